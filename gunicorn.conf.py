@@ -0,0 +1,33 @@
+# Gunicorn settings for production (picked up automatically from the working directory)
+import os
+from src.config import Config
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Cached responses are invalidated in place, which only reaches other workers through a
+# shared (Redis) cache; SimpleCache lives in one process, so it gets a single worker
+_shared_cache = Config.CACHE_TYPE == 'RedisCache'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 if _shared_cache else 1))
+if workers > 1 and not _shared_cache:
+    raise RuntimeError('WEB_CONCURRENCY > 1 needs a shared cache: set CACHE_REDIS_URL or a redis:// RATE_LIMIT_STORAGE_URL')
+
+# Handlers block on the database and Stripe; threaded workers keep serving other
+# requests while one waits instead of tying up the whole process.
+# GUNICORN_WORKER_CLASS=gevent trades the thread cap for greenlets (needs gevent, and
+# psycogreen so PostgreSQL queries yield too)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = 60
+accesslog = '-'
+
+def post_fork(server, worker):
+    """Make psycopg2 cooperative in gevent workers"""
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen not installed: database queries will block the gevent worker')
+        else:
+            patch_psycopg()
@@ -0,0 +1,60 @@
+from datetime import datetime
+from celery import Celery, Task, shared_task
+from sqlalchemy import update
+from sqlalchemy.exc import SQLAlchemyError
+from src.models.user import db
+from src.models.cart import Order, PaymentStatus, PAYMENT_STATUS_SOURCES, StripeEvent, StripeEventStatus
+
+# Stripe events that change an order's payment status
+WEBHOOK_PAYMENT_STATUSES = {
+    'payment_intent.succeeded': PaymentStatus.COMPLETED,
+    'payment_intent.payment_failed': PaymentStatus.FAILED
+}
+
+def celery_init_app(app):
+    """Create the Celery app for a Flask app; every task runs inside its app context"""
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+    
+    celery = Celery(app.name, task_cls=FlaskTask)
+    celery.config_from_object(app.config['CELERY'])
+    celery.set_default()
+    app.extensions['celery'] = celery
+    return celery
+
+@shared_task(bind=True, ignore_result=True, autoretry_for=(SQLAlchemyError,), retry_backoff=True, max_retries=5)
+def process_stripe_event(self, event_id):
+    """Apply a stored Stripe event to its order; returns the order id, None if nothing changed"""
+    event = db.session.get(StripeEvent, event_id)
+    if event is None or event.status != StripeEventStatus.UNPROCESSED.value:
+        return None
+    
+    try:
+        # Look up and update the order in one round trip; a late or out-of-order event
+        # matches no row and is a no-op
+        new_status = WEBHOOK_PAYMENT_STATUSES[event.type]
+        order_id = db.session.execute(
+            update(Order)
+            .where(
+                Order.stripe_payment_intent_id == event.payload['data']['object']['id'],
+                Order.payment_status.in_(PAYMENT_STATUS_SOURCES[new_status])
+            )
+            .values(payment_status=new_status.value)
+            .returning(Order.id)
+        ).scalar()
+        event.status = StripeEventStatus.PROCESSED.value
+        event.processed_at = datetime.utcnow()
+        db.session.commit()
+        return order_id
+    except SQLAlchemyError:
+        db.session.rollback()
+        if self.request.retries >= self.max_retries:
+            # Out of retries: leave the event marked for inspection
+            db.session.execute(
+                update(StripeEvent).where(StripeEvent.id == event_id)
+                .values(status=StripeEventStatus.ERRORED.value, processed_at=datetime.utcnow())
+            )
+            db.session.commit()
+        raise
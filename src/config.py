@@ -1,47 +1,107 @@
 import os
+from enum import IntEnum
 from dotenv import load_dotenv
 
-load_dotenv()
+# Parse .env once per process tree; forked workers and subprocesses inherit the result
+if not os.environ.get('_DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['_DOTENV_LOADED'] = '1'
+
+_ENV_CACHE = {}
+
+def _env(key, default=None):
+    """Read an environment variable once, falling back to default when unset or empty"""
+    if key not in _ENV_CACHE:
+        _ENV_CACHE[key] = os.environ.get(key) or default
+    return _ENV_CACHE[key]
+
+class PaymentMethod(IntEnum):
+    """Supported payment methods; the value is the index into the fee tables"""
+    CREDIT_CARD = 0
+    DEBIT_CARD = 1
+    PIX = 2
+    BOLETO = 3
+    
+    @classmethod
+    def coerce(cls, value):
+        """Resolve a method name such as 'credit_card' (or a member) to a PaymentMethod"""
+        if isinstance(value, cls):
+            return value
+        try:
+            return cls[value.upper()]
+        except (KeyError, AttributeError):
+            raise ValueError(f"Unsupported payment method: {value}") from None
 
 class Config:
     # Flask Configuration
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    SECRET_KEY = _env('SECRET_KEY', 'dev-secret-key-change-in-production')
     
     # JWT Configuration
-    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
+    JWT_SECRET_KEY = _env('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = 3600  # 1 hour
     JWT_REFRESH_TOKEN_EXPIRES = 2592000  # 30 days
     
     # Database Configuration
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+    SQLALCHEMY_DATABASE_URI = _env('DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool (server databases only; SQLite has no connections worth pooling)
+    DB_POOL_SIZE = int(_env('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(_env('DB_MAX_OVERFLOW', 20))
+    DB_POOL_RECYCLE = int(_env('DB_POOL_RECYCLE', 1800))  # 30 minutes
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {'check_same_thread': False}
+    } if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_pre_ping': True,
+        'pool_recycle': DB_POOL_RECYCLE
+    }
+    
+    # Password hashing cost (bcrypt log2 rounds); each step doubles hash/verify time
+    BCRYPT_ROUNDS = int(_env('BCRYPT_ROUNDS', 12))
+    
     # Stripe Configuration
-    STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
-    STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
-    STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    STRIPE_PUBLISHABLE_KEY = _env('STRIPE_PUBLISHABLE_KEY')
+    STRIPE_SECRET_KEY = _env('STRIPE_SECRET_KEY')
+    STRIPE_WEBHOOK_SECRET = _env('STRIPE_WEBHOOK_SECRET')
     
     # Rate Limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL') or 'memory://'
+    RATELIMIT_STORAGE_URL = _env('RATE_LIMIT_STORAGE_URL', 'memory://')
     
-    # CORS Configuration
-    CORS_ORIGINS = os.environ.get('CORS_ORIGINS') or '*'
-    
-    # Tax Configuration (Brazilian rates)
-    TAX_RATES = {
-        'credit_card': 0.034,  # 3.4%
-        'debit_card': 0.029,   # 2.9%
-        'pix': 0.0099,         # 0.99%
-        'boleto': 0.0349       # R$ 3.49 flat fee
-    }
+    # Response caching (shares the rate limiter's Redis when one is configured)
+    CACHE_REDIS_URL = _env('CACHE_REDIS_URL', RATELIMIT_STORAGE_URL if RATELIMIT_STORAGE_URL.startswith('redis') else None)
+    CACHE_TYPE = 'RedisCache' if CACHE_REDIS_URL else 'SimpleCache'
+    CACHE_DEFAULT_TIMEOUT = int(_env('CACHE_DEFAULT_TIMEOUT', 60))
+    CACHE_KEY_PREFIX = 'ecommerce:'
     
-    # Fixed fees (in cents)
-    FIXED_FEES = {
-        'credit_card': 60,     # R$ 0.60
-        'debit_card': 60,      # R$ 0.60
-        'pix': 0,              # No fixed fee
-        'boleto': 349          # R$ 3.49
+    # Background tasks (Stripe webhook processing); without a broker tasks run inline
+    CELERY_BROKER_URL = _env('CELERY_BROKER_URL', RATELIMIT_STORAGE_URL if RATELIMIT_STORAGE_URL.startswith('redis') else None)
+    CELERY = {
+        'broker_url': CELERY_BROKER_URL or 'memory://',
+        'task_always_eager': CELERY_BROKER_URL is None,
+        'task_ignore_result': True,
+        'task_acks_late': True
     }
+    
+    # CORS Configuration
+    CORS_ORIGINS = _env('CORS_ORIGINS', '*')
+    
+    # Tax Configuration (Brazilian rates), indexed by PaymentMethod
+    TAX_RATES = (
+        0.034,   # credit_card: 3.4%
+        0.029,   # debit_card: 2.9%
+        0.0099,  # pix: 0.99%
+        0.0349   # boleto: R$ 3.49 flat fee
+    )
+    
+    # Fixed fees (in cents), indexed by PaymentMethod
+    FIXED_FEES = (
+        60,      # credit_card: R$ 0.60
+        60,      # debit_card: R$ 0.60
+        0,       # pix: No fixed fee
+        349      # boleto: R$ 3.49
+    )
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -50,9 +110,6 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     FLASK_ENV = 'production'
-    
-    # Production database (PostgreSQL recommended)
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or Config.SQLALCHEMY_DATABASE_URI
 
 config = {
     'development': DevelopmentConfig,
@@ -4,36 +4,69 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.types import Enum as SQLEnum
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from whitenoise import WhiteNoise
 
 # Import models and database
-from src.models.user import db, User, UserRole
-from src.models.product import Product, Category
+from src.models.user import db, User, UserRole, USERS_TRIGRAM_INDEXES
+from src.models.product import Product, Category, PRODUCTS_FTS_INDEX
 from src.models.cart import Cart, CartItem, Order, OrderItem
 
-# Import routes
-from src.routes.auth import auth_bp
-from src.routes.products import products_bp
-from src.routes.cart import cart_bp
-from src.routes.orders import orders_bp
-from src.routes.payments import payments_bp
-from src.routes.admin import admin_bp
-
 # Import configuration
 from src.config import config
+from src.utils.json_provider import OrjsonProvider
+from src.utils.cache import cache
+from src.celery_app import celery_init_app
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune SQLite connections: WAL journaling, relaxed fsync, larger cache, enforced FKs"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=-64000')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+def _upgrade_order_status_columns(connection):
+    """Move orders.status/payment_status from Enum storage (member names) to lowercase string values"""
+    columns = {column['name']: column['type'] for column in inspect(connection).get_columns('orders')}
+    for name in ('status', 'payment_status'):
+        if isinstance(columns[name], SQLEnum):
+            # Native ENUM columns (PostgreSQL, MySQL) only accept the old member names
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text(f"ALTER TABLE orders ALTER COLUMN {name} TYPE VARCHAR(20) USING lower({name}::text)"))
+            else:
+                connection.execute(text(f"ALTER TABLE orders MODIFY {name} VARCHAR(20) NOT NULL"))
+        connection.execute(text(f"UPDATE orders SET {name} = lower({name}) WHERE {name} <> lower({name})"))
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("DROP TYPE IF EXISTS orderstatus"))
+        connection.execute(text("DROP TYPE IF EXISTS paymentstatus"))
 
 def create_app(config_name='default'):
     app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.json = OrjsonProvider(app)
+    
+    # Serve static assets from WSGI middleware (precomputed headers, no Flask dispatch per file)
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=app.static_folder, index_file=True)
     
     # Load configuration
     app.config.from_object(config[config_name])
     
     # Initialize extensions
     db.init_app(app)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        with app.app_context():
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
     jwt = JWTManager(app)
+    cache.init_app(app)
+    celery_init_app(app)
     
     # Configure CORS
     CORS(app, origins=app.config.get('CORS_ORIGINS', '*'))
@@ -46,6 +79,15 @@ def create_app(config_name='default'):
         default_limits=["1000 per hour"]
     )
     
+    # Import routes here so that importing this module (models, CLI, tests) does not
+    # pull in every blueprint and the Stripe SDK until an app is actually built
+    from src.routes.auth import auth_bp
+    from src.routes.products import products_bp
+    from src.routes.cart import cart_bp
+    from src.routes.orders import orders_bp
+    from src.routes.payments import payments_bp
+    from src.routes.admin import admin_bp
+    
     # Rate limit for auth endpoints
     limiter.limit("5 per minute")(auth_bp)
     
@@ -57,10 +99,23 @@ def create_app(config_name='default'):
     app.register_blueprint(payments_bp, url_prefix='/api/payments')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     
-    # Create database tables
-    with app.app_context():
+    # Database setup runs once via `flask init-db`, not on every worker start
+    @app.cli.command('init-db')
+    def init_db():
+        """Create database tables and seed the default admin user and categories"""
         db.create_all()
         
+        # create_all skips existing tables; upgrade columns and add any indexes introduced since they were created
+        with db.engine.begin() as connection:
+            _upgrade_order_status_columns(connection)
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            # Indexes from after_create DDL (PostgreSQL only) only fire with a new table
+            PRODUCTS_FTS_INDEX(Product.__table__, connection)
+            for ddl in USERS_TRIGRAM_INDEXES:
+                ddl(User.__table__, connection)
+        
         # Create default admin user if it doesn't exist
         admin_user = User.query.filter_by(role=UserRole.ADMIN).first()
         if not admin_user:
@@ -82,8 +137,8 @@ def create_app(config_name='default'):
                 Category(name='Controladores', description='Controladores e PLCs')
             ]
             
-            for category in categories:
-                db.session.add(category)
+            # Categories have no cascades or insert hooks, so skip per-object unit-of-work bookkeeping
+            db.session.bulk_save_objects(categories)
             
             try:
                 db.session.commit()
@@ -106,7 +161,7 @@ def create_app(config_name='default'):
     def missing_token_callback(error):
         return {'error': 'Authorization token is required'}, 401
 
-    # Frontend serving routes
+    # Frontend SPA fallback (existing static files are served by WhiteNoise before reaching Flask)
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve(path):
@@ -114,14 +169,11 @@ def create_app(config_name='default'):
         if static_folder_path is None:
             return "Static folder not configured", 404
 
-        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-            return send_from_directory(static_folder_path, path)
+        index_path = os.path.join(static_folder_path, 'index.html')
+        if os.path.exists(index_path):
+            return send_from_directory(static_folder_path, 'index.html')
         else:
-            index_path = os.path.join(static_folder_path, 'index.html')
-            if os.path.exists(index_path):
-                return send_from_directory(static_folder_path, 'index.html')
-            else:
-                return "E-commerce API is running! Check /api endpoints for API documentation.", 200
+            return "E-commerce API is running! Check /api endpoints for API documentation.", 200
 
     # Health check endpoint
     @app.route('/health')
@@ -133,6 +185,9 @@ def create_app(config_name='default'):
 # Create app instance
 app = create_app(os.environ.get('FLASK_ENV', 'development'))
 
+# Celery worker entry point: celery -A src.main:celery_app worker
+celery_app = app.extensions['celery']
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
 
@@ -1,45 +1,92 @@
 from src.models.user import db
+from src.models.product import Product
 from datetime import datetime
+from decimal import Decimal
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy import Text
+from sqlalchemy import Text, event, func, inspect, update, cast
+from sqlalchemy.orm import reconstructor, object_session, validates, column_property
+from sqlalchemy.orm.base import NO_VALUE
+from sqlalchemy.orm.util import identity_key
 from enum import Enum
+from ulid import ULID
 
 class Cart(db.Model):
     __tablename__ = 'carts'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True, index=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     items = db.relationship('CartItem', backref='cart', lazy=True, cascade='all, delete-orphan')
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = {}
+
+    @reconstructor
+    def _init_on_load(self):
+        # Transient per-instance cache of computed totals (not a column)
+        self._cache = {}
+
     def __repr__(self):
         return f'<Cart {self.id} - User {self.user_id}>'
 
+    def _invalidate_cache(self):
+        """Drop cached totals so they are recomputed on next access"""
+        self._cache.clear()
+
+    @classmethod
+    def bulk_total_cents(cls, session, cart_id):
+        """Cart total in integer cents, summed in SQL over integer operands"""
+        line_cents = CartItem.quantity * cast(func.round(CartItem.price_at_time * 100), db.Integer)
+        return int(session.query(
+            func.coalesce(func.sum(line_cents), 0)
+        ).filter(CartItem.cart_id == cart_id).scalar())
+
+    @classmethod
+    def compute_total(cls, session, cart_id):
+        """Sum item subtotals in SQL without loading the cart items"""
+        return Decimal(cls.bulk_total_cents(session, cart_id)).scaleb(-2)
+
     def get_total(self):
         """Calculate cart total"""
-        return sum(item.get_subtotal() for item in self.items)
+        if 'total' not in self._cache:
+            if self.id is not None and inspect(self).attrs['items'].loaded_value is NO_VALUE:
+                # Items not loaded yet: aggregate in the database instead of hydrating them
+                self._cache['total'] = Cart.compute_total(db.session, self.id)
+            else:
+                self._cache['total'] = Decimal(sum(item.get_subtotal_cents() for item in self.items)).scaleb(-2)
+        return self._cache['total']
 
     def get_items_count(self):
         """Get total number of items in cart"""
-        return sum(item.quantity for item in self.items)
+        if 'items_count' not in self._cache:
+            self._cache['items_count'] = sum(item.quantity for item in self.items)
+        return self._cache['items_count']
 
     def clear(self):
-        """Remove all items from cart"""
-        for item in self.items:
-            db.session.delete(item)
+        """Remove all items from cart with a single DELETE
+
+        Bulk deletes bypass the unit of work, so already-loaded CartItem
+        instances become stale; the items collection is expired so it
+        reloads (empty) on next access.
+        """
+        db.session.query(CartItem).filter(CartItem.cart_id == self.id).delete(synchronize_session='fetch')
+        db.session.expire(self, ['items'])
+        self._invalidate_cache()
 
     def to_dict(self):
+        total = self.get_total()
         return {
             'id': self.id,
             'user_id': self.user_id,
             'items': [item.to_dict() for item in self.items],
-            'total': float(self.get_total()),
+            'total': total,
             'items_count': self.get_items_count(),
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
 class CartItem(db.Model):
@@ -52,28 +99,67 @@ class CartItem(db.Model):
     price_at_time = db.Column(db.Numeric(10, 2), nullable=False)  # Price when added to cart
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Unit price in integer cents, computed by the database alongside the row
+    price_cents = column_property(cast(func.round(price_at_time * 100), db.Integer))
 
     def __repr__(self):
         return f'<CartItem {self.id} - Product {self.product_id}>'
 
+    def get_price_cents(self):
+        """Unit price in integer cents"""
+        if self.price_cents is None:
+            # Pending instance that has not been loaded from the database yet
+            return int(Decimal(str(self.price_at_time)).scaleb(2))
+        return self.price_cents
+
+    def get_subtotal_cents(self):
+        """Calculate item subtotal in integer cents"""
+        return self.quantity * self.get_price_cents()
+
     def get_subtotal(self):
         """Calculate item subtotal"""
-        return self.quantity * self.price_at_time
+        return Decimal(self.get_subtotal_cents()).scaleb(-2)
 
-    def to_dict(self):
+    def to_dict(self, include_product=True):
         return {
             'id': self.id,
             'cart_id': self.cart_id,
             'product_id': self.product_id,
-            'product': self.product.to_dict() if self.product else None,
+            'product': self.product.to_dict() if include_product and self.product else None,
             'quantity': self.quantity,
-            'price_at_time': float(self.price_at_time),
-            'subtotal': float(self.get_subtotal()),
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'price_at_time': self.price_at_time,
+            'subtotal': self.get_subtotal(),
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
-class OrderStatus(Enum):
+@event.listens_for(CartItem, 'after_insert')
+@event.listens_for(CartItem, 'after_update')
+@event.listens_for(CartItem, 'after_delete')
+def _invalidate_cart_cache(mapper, connection, target):
+    """Invalidate cached totals of the parent cart when one of its items changes"""
+    session = object_session(target)
+    if session is None:
+        return
+    # Only touch a cart already in the identity map; never trigger a load mid-flush
+    cart = session.identity_map.get(identity_key(Cart, target.cart_id))
+    if cart is not None:
+        cart._invalidate_cache()
+
+@event.listens_for(Cart, 'expire')
+def _invalidate_cart_cache_on_expire(target, attrs):
+    """Invalidate cached totals when the cart is expired (e.g. on commit)"""
+    # The instance may already have been garbage collected
+    if target is not None:
+        target._invalidate_cache()
+
+@event.listens_for(Cart, 'refresh')
+def _invalidate_cart_cache_on_refresh(target, context, attrs):
+    """Invalidate cached totals when the cart is reloaded from the database"""
+    target._invalidate_cache()
+
+class OrderStatus(str, Enum):
     PENDING = "pending"
     PAID = "paid"
     PROCESSING = "processing"
@@ -82,23 +168,46 @@ class OrderStatus(Enum):
     CANCELLED = "cancelled"
     REFUNDED = "refunded"
 
-class PaymentStatus(Enum):
+class PaymentStatus(str, Enum):
     PENDING = "pending"
     COMPLETED = "completed"
     FAILED = "failed"
     REFUNDED = "refunded"
     PARTIALLY_REFUNDED = "partially_refunded"
 
+# Payment statuses a Stripe result may move an order from: a success can still settle an
+# order whose earlier attempt failed, but nothing overwrites a completed or refunded payment
+PAYMENT_STATUS_SOURCES = {
+    PaymentStatus.COMPLETED: (PaymentStatus.PENDING.value, PaymentStatus.FAILED.value),
+    PaymentStatus.FAILED: (PaymentStatus.PENDING.value,)
+}
+
+# Statuses are stored as plain strings; these sets back the model validators
+ORDER_STATUS_VALUES = frozenset(status.value for status in OrderStatus)
+PAYMENT_STATUS_VALUES = frozenset(status.value for status in PaymentStatus)
+
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Match the listing/report filters and their ORDER BY created_at
+        db.Index('ix_orders_user_created', 'user_id', db.text('created_at DESC')),
+        db.Index('ix_orders_status_created', 'status', 'created_at'),
+        # Revenue sums read total_amount straight from the index on PostgreSQL
+        db.Index('ix_orders_paystatus_created', 'payment_status', 'created_at', postgresql_include=['total_amount']),
+        # Payment confirmation and webhook lookups; INCLUDE lets PostgreSQL answer from the index
+        db.Index(
+            'ix_orders_stripe_intent', 'stripe_payment_intent_id', unique=True,
+            postgresql_include=['payment_status', 'user_id']
+        ),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     order_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
     
     # Order status
-    status = db.Column(db.Enum(OrderStatus), nullable=False, default=OrderStatus.PENDING)
-    payment_status = db.Column(db.Enum(PaymentStatus), nullable=False, default=PaymentStatus.PENDING)
+    status = db.Column(db.String(20), nullable=False, default=OrderStatus.PENDING.value)
+    payment_status = db.Column(db.String(20), nullable=False, default=PaymentStatus.PENDING.value)
     
     # Pricing
     subtotal = db.Column(db.Numeric(10, 2), nullable=False)
@@ -118,22 +227,38 @@ class Order(db.Model):
     notes = db.Column(Text, nullable=True)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)  # Range-filtered by reports
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     shipped_at = db.Column(db.DateTime, nullable=True)
     delivered_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
-    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    # Orders are almost always rendered with their items; load them in one IN query per batch
+    items = db.relationship('OrderItem', backref='order', lazy='selectin', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Order {self.order_number}>'
 
+    @validates('status')
+    def validate_status(self, key, value):
+        """Accept an OrderStatus or its value and store the plain string"""
+        value = getattr(value, 'value', value)
+        if value not in ORDER_STATUS_VALUES:
+            raise ValueError(f"Invalid order status: {value}")
+        return value
+
+    @validates('payment_status')
+    def validate_payment_status(self, key, value):
+        """Accept a PaymentStatus or its value and store the plain string"""
+        value = getattr(value, 'value', value)
+        if value not in PAYMENT_STATUS_VALUES:
+            raise ValueError(f"Invalid payment status: {value}")
+        return value
+
     @staticmethod
     def generate_order_number():
-        """Generate unique order number"""
-        import uuid
-        return f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
+        """Generate unique, time-sortable order number (ULID keeps the index append-only)"""
+        return f"ORD-{ULID()}"
 
     def can_be_cancelled(self):
         """Check if order can be cancelled"""
@@ -143,10 +268,19 @@ class Order(db.Model):
         """Cancel order"""
         if self.can_be_cancelled():
             self.status = OrderStatus.CANCELLED
-            # Restore stock
-            for item in self.items:
-                if item.product:
-                    item.product.increase_stock(item.quantity)
+            # Restore stock for every item in a single UPDATE
+            restored = db.session.query(func.sum(OrderItem.quantity)).filter(
+                OrderItem.order_id == self.id,
+                OrderItem.product_id == Product.id
+            ).scalar_subquery()
+            db.session.execute(
+                update(Product)
+                .where(Product.id.in_(
+                    db.session.query(OrderItem.product_id).filter(OrderItem.order_id == self.id)
+                ))
+                .values(stock_quantity=Product.stock_quantity + restored)
+                .execution_options(synchronize_session=False)
+            )
             return True
         return False
 
@@ -155,25 +289,29 @@ class Order(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'order_number': self.order_number,
-            'status': self.status.value,
-            'payment_status': self.payment_status.value,
-            'subtotal': float(self.subtotal),
-            'tax_amount': float(self.tax_amount),
-            'shipping_amount': float(self.shipping_amount),
-            'total_amount': float(self.total_amount),
+            'status': self.status,
+            'payment_status': self.payment_status,
+            'subtotal': self.subtotal,
+            'tax_amount': self.tax_amount,
+            'shipping_amount': self.shipping_amount,
+            'total_amount': self.total_amount,
             'payment_method': self.payment_method,
             'shipping_address': self.shipping_address,
             'billing_address': self.billing_address,
             'notes': self.notes,
             'items': [item.to_dict() for item in self.items],
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'shipped_at': self.shipped_at.isoformat() if self.shipped_at else None,
-            'delivered_at': self.delivered_at.isoformat() if self.delivered_at else None
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'shipped_at': self.shipped_at,
+            'delivered_at': self.delivered_at
         }
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        # Covers the sales-per-product joins in the admin reports
+        db.Index('ix_order_items_order_product_qty', 'order_id', 'product_id', 'quantity'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
@@ -185,25 +323,59 @@ class OrderItem(db.Model):
     product_name = db.Column(db.String(200), nullable=False)
     product_sku = db.Column(db.String(50), nullable=False)
     product_image = db.Column(db.String(500), nullable=True)
+    
+    # Unit price in integer cents, computed by the database alongside the row
+    price_cents = column_property(cast(func.round(price_at_time * 100), db.Integer))
 
     def __repr__(self):
         return f'<OrderItem {self.id} - {self.product_name}>'
 
+    def get_price_cents(self):
+        """Unit price in integer cents"""
+        if self.price_cents is None:
+            # Pending instance that has not been loaded from the database yet
+            return int(Decimal(str(self.price_at_time)).scaleb(2))
+        return self.price_cents
+
+    def get_subtotal_cents(self):
+        """Calculate item subtotal in integer cents"""
+        return self.quantity * self.get_price_cents()
+
     def get_subtotal(self):
         """Calculate item subtotal"""
-        return self.quantity * self.price_at_time
+        return Decimal(self.get_subtotal_cents()).scaleb(-2)
 
-    def to_dict(self):
+    def to_dict(self, include_product=True):
         return {
             'id': self.id,
             'order_id': self.order_id,
             'product_id': self.product_id,
-            'product': self.product.to_dict() if self.product else None,
+            'product': self.product.to_dict() if include_product and self.product else None,
             'quantity': self.quantity,
-            'price_at_time': float(self.price_at_time),
-            'subtotal': float(self.get_subtotal()),
+            'price_at_time': self.price_at_time,
+            'subtotal': self.get_subtotal(),
             'product_name': self.product_name,
             'product_sku': self.product_sku,
             'product_image': self.product_image
         }
 
+
+class StripeEventStatus(str, Enum):
+    UNPROCESSED = "unprocessed"
+    PROCESSED = "processed"
+    IGNORED = "ignored"
+    ERRORED = "errored"
+
+class StripeEvent(db.Model):
+    """Verified Stripe webhook event; keyed by Stripe's event id so redeliveries are recorded once"""
+    __tablename__ = 'stripe_events'
+    
+    id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=StripeEventStatus.UNPROCESSED.value)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<StripeEvent {self.id} {self.type}>'
@@ -1,7 +1,17 @@
 from src.models.user import db
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy import Text
+from sqlalchemy import Text, DDL, event
+from sqlalchemy.orm import reconstructor
+
+# Full-text search document; the GIN index and Product.search must use the exact same expression
+SEARCH_DOCUMENT = (
+    "to_tsvector('portuguese', coalesce(products.name, '') || ' ' || coalesce(products.description, '') "
+    "|| ' ' || coalesce(products.brand, '') || ' ' || coalesce(products.model, ''))"
+)
+
+# Search box syntax: words, "quoted phrases", OR and -excluded terms
+SEARCH_QUERY = "websearch_to_tsquery('portuguese', :search_query)"
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -28,8 +38,8 @@ class Category(db.Model):
             'description': self.description,
             'parent_id': self.parent_id,
             'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
 class Product(db.Model):
@@ -61,13 +71,49 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Match the storefront search predicates (see Product.search)
+        db.Index('ix_products_active_cat_price', 'is_active', 'category_id', 'price'),
+        db.Index('ix_products_active_stock', 'is_active', 'stock_quantity'),
+        db.Index('ix_products_brand_lower', db.func.lower(brand)),
+        # Storefront listing order, for keyset pagination (see get_products)
+        db.Index('ix_products_active_featured_name', 'is_active', db.text('is_featured DESC'), 'name', 'id'),
+    )
+    
     # Relationships
-    cart_items = db.relationship('CartItem', backref='product', lazy=True, cascade='all, delete-orphan')
-    order_items = db.relationship('OrderItem', backref='product', lazy=True)
+    # Items always render their product, so load it in one IN query per batch of items
+    cart_items = db.relationship('CartItem', backref=db.backref('product', lazy='selectin'), lazy=True, cascade='all, delete-orphan')
+    order_items = db.relationship('OrderItem', backref=db.backref('product', lazy='selectin'), lazy=True)
+
+    def __init__(self, **kwargs):
+        # Set before the mapped attributes so the 'set' listeners below can invalidate it
+        self._cache = {}
+        super().__init__(**kwargs)
+
+    @reconstructor
+    def _init_on_load(self):
+        # Transient per-instance cache of normalized JSON values (not a column)
+        self._cache = {}
 
     def __repr__(self):
         return f'<Product {self.name}>'
 
+    def _invalidate_cache(self):
+        """Drop cached JSON values so they are recomputed on next access"""
+        self._cache.clear()
+
+    def get_images(self):
+        """Get image URLs (never None)"""
+        if 'images' not in self._cache:
+            self._cache['images'] = self.images or []
+        return self._cache['images']
+
+    def get_specifications(self):
+        """Get technical specifications (never None)"""
+        if 'specifications' not in self._cache:
+            self._cache['specifications'] = self.specifications or {}
+        return self._cache['specifications']
+
     def is_in_stock(self, quantity=1):
         """Check if product has enough stock"""
         return self.stock_quantity >= quantity
@@ -85,9 +131,8 @@ class Product(db.Model):
 
     def get_main_image(self):
         """Get main product image"""
-        if self.images and len(self.images) > 0:
-            return self.images[0]
-        return None
+        images = self.get_images()
+        return images[0] if images else None
 
     def to_dict(self, include_stock=False):
         """Convert product to dictionary"""
@@ -95,20 +140,20 @@ class Product(db.Model):
             'id': self.id,
             'name': self.name,
             'description': self.description,
-            'price': float(self.price),
+            'price': self.price,
             'category_id': self.category_id,
             'category': self.category.to_dict() if self.category else None,
             'brand': self.brand,
             'model': self.model,
             'sku': self.sku,
-            'images': self.images or [],
-            'specifications': self.specifications or {},
+            'images': self.get_images(),
+            'specifications': self.get_specifications(),
             'is_active': self.is_active,
             'is_featured': self.is_featured,
             'meta_title': self.meta_title,
             'meta_description': self.meta_description,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
         
         if include_stock:
@@ -116,26 +161,39 @@ class Product(db.Model):
             
         return data
 
+    @staticmethod
+    def search_rank(query):
+        """Full-text relevance of products to a search query (PostgreSQL only)"""
+        return db.text(f"ts_rank_cd({SEARCH_DOCUMENT}, {SEARCH_QUERY})").bindparams(search_query=query)
+
     @staticmethod
     def search(query, category_id=None, brand=None, min_price=None, max_price=None, in_stock_only=True):
         """Search products with filters"""
         filters = [Product.is_active == True]
         
         if query:
-            filters.append(
-                db.or_(
-                    Product.name.ilike(f'%{query}%'),
-                    Product.description.ilike(f'%{query}%'),
-                    Product.brand.ilike(f'%{query}%'),
-                    Product.model.ilike(f'%{query}%')
+            if db.engine.dialect.name == 'postgresql':
+                # Served by the ix_products_fts GIN index
+                filters.append(
+                    db.text(f"{SEARCH_DOCUMENT} @@ {SEARCH_QUERY}")
+                    .bindparams(search_query=query)
+                )
+            else:
+                filters.append(
+                    db.or_(
+                        Product.name.ilike(f'%{query}%'),
+                        Product.description.ilike(f'%{query}%'),
+                        Product.brand.ilike(f'%{query}%'),
+                        Product.model.ilike(f'%{query}%')
+                    )
                 )
-            )
         
         if category_id:
             filters.append(Product.category_id == category_id)
             
         if brand:
-            filters.append(Product.brand.ilike(f'%{brand}%'))
+            # Case-insensitive exact match so ix_products_brand_lower can be used
+            filters.append(db.func.lower(Product.brand) == brand.lower())
             
         if min_price is not None:
             filters.append(Product.price >= min_price)
@@ -148,3 +206,22 @@ class Product(db.Model):
         
         return Product.query.filter(*filters)
 
+@event.listens_for(Product.images, 'set')
+@event.listens_for(Product.specifications, 'set')
+def _invalidate_json_cache_on_set(target, value, oldvalue, initiator):
+    """Invalidate cached JSON values when they are assigned"""
+    target._invalidate_cache()
+
+@event.listens_for(Product, 'expire')
+def _invalidate_json_cache_on_expire(target, attrs):
+    """Invalidate cached JSON values when the instance is expired (e.g. on commit)"""
+    # The instance may already have been garbage collected
+    if target is not None:
+        target._invalidate_cache()
+
+# PostgreSQL only: SQLite has no tsvector and keeps the ILIKE fallback in Product.search.
+# init-db also runs it for products tables created before the index existed
+PRODUCTS_FTS_INDEX = DDL(
+    f"CREATE INDEX IF NOT EXISTS ix_products_fts ON products USING gin ({SEARCH_DOCUMENT})"
+).execute_if(dialect='postgresql')
+event.listen(Product.__table__, 'after_create', PRODUCTS_FTS_INDEX)
@@ -1,10 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
 import bcrypt
 from enum import Enum
+from src.config import Config
 
 db = SQLAlchemy()
 
+def _native_thread_executor():
+    """ThreadPoolExecutor class whose workers are real OS threads"""
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            # Under gevent workers patched threads are greenlets: hashing there would stall
+            # every request of the process. gevent's executor runs on native threads.
+            from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+            return GeventThreadPoolExecutor
+    return ThreadPoolExecutor
+
+# bcrypt releases the GIL while hashing; a pool sized to the CPUs runs hashes in parallel
+# without letting a burst of logins occupy every request thread of the worker
+password_hash_executor = _native_thread_executor()(max_workers=os.cpu_count(), thread_name_prefix='password-hash')
+
 class UserRole(Enum):
     USER = "user"
     ADMIN = "admin"
@@ -32,12 +52,16 @@ class User(db.Model):
 
     def set_password(self, password):
         """Hash and set password"""
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        salt = bcrypt.gensalt(rounds=Config.BCRYPT_ROUNDS)
+        self.password_hash = password_hash_executor.submit(
+            bcrypt.hashpw, password.encode('utf-8'), salt
+        ).result().decode('utf-8')
 
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return password_hash_executor.submit(
+            bcrypt.checkpw, password.encode('utf-8'), self.password_hash.encode('utf-8')
+        ).result()
 
     def is_admin(self):
         """Check if user is admin"""
@@ -53,8 +77,8 @@ class User(db.Model):
             'phone': self.phone,
             'role': self.role.value,
             'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
         
         if include_sensitive:
@@ -74,3 +98,12 @@ class User(db.Model):
         admin.set_password(password)
         return admin
 
+# PostgreSQL only: trigram GIN indexes let the admin's leading-wildcard ILIKE user search
+# use an index instead of scanning the table. init-db also runs them for users tables
+# created before the indexes existed
+USERS_TRIGRAM_INDEXES = [DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql')] + [
+    DDL(f"CREATE INDEX IF NOT EXISTS ix_users_{_column}_trgm ON users USING gin ({_column} gin_trgm_ops)").execute_if(dialect='postgresql')
+    for _column in ('email', 'first_name', 'last_name')
+]
+for _ddl in USERS_TRIGRAM_INDEXES:
+    event.listen(User.__table__, 'after_create', _ddl)
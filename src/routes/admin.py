@@ -1,14 +1,17 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity
 from marshmallow import ValidationError
-from sqlalchemy import func, desc
-from datetime import datetime, timedelta
+from sqlalchemy import func, desc, case, and_, select
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, time
+from concurrent.futures import ThreadPoolExecutor
 from src.models.user import db, User, UserRole
 from src.models.product import Product, Category
-from src.models.cart import Order, OrderStatus, PaymentStatus
+from src.models.cart import Order, OrderItem, OrderStatus, PaymentStatus
 from src.schemas.user_schema import AdminUserCreateSchema, UserResponseSchema
 from src.utils.decorators import admin_required, handle_errors
 from src.utils.helpers import paginate_query
+from src.utils.cache import cache, cache_ok_only, invalidate_user, DASHBOARD_KEY
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -16,59 +19,76 @@ admin_bp = Blueprint('admin', __name__)
 admin_user_create_schema = AdminUserCreateSchema()
 user_response_schema = UserResponseSchema()
 
+# User columns the listing serializes (everything but the password hash)
+USER_LIST_COLUMNS = tuple(
+    getattr(User, name) for name in user_response_schema.dump_fields
+)
+
+# Shared pool for running independent report queries concurrently
+report_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='admin-report')
+
+def submit_query(statement):
+    """Run a SELECT on the report pool with its own pooled connection; returns a future of its rows"""
+    engine = db.engine  # Resolved here; pool threads have no app context
+    
+    def execute():
+        with engine.connect() as connection:
+            return connection.execute(statement).all()
+    
+    return report_executor.submit(execute)
+
 @admin_bp.route('/dashboard', methods=['GET'])
 @admin_required
+@cache.cached(timeout=30, key_prefix=DASHBOARD_KEY, response_filter=cache_ok_only)
 @handle_errors
 def get_dashboard_stats():
     """Get dashboard statistics"""
-    # Date ranges
-    today = datetime.utcnow().date()
+    # Date ranges (compared against created_at directly so its index stays usable)
+    today = datetime.combine(datetime.utcnow().date(), time.min)
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    # Total counts
-    total_users = User.query.count()
-    total_products = Product.query.filter_by(is_active=True).count()
-    total_orders = Order.query.count()
-    
-    # Recent stats
-    orders_today = Order.query.filter(func.date(Order.created_at) == today).count()
-    orders_this_week = Order.query.filter(func.date(Order.created_at) >= week_ago).count()
-    orders_this_month = Order.query.filter(func.date(Order.created_at) >= month_ago).count()
-    
-    # Revenue stats
-    revenue_today = db.session.query(func.sum(Order.total_amount)).filter(
-        func.date(Order.created_at) == today,
-        Order.payment_status == PaymentStatus.COMPLETED
-    ).scalar() or 0
-    
-    revenue_this_week = db.session.query(func.sum(Order.total_amount)).filter(
-        func.date(Order.created_at) >= week_ago,
-        Order.payment_status == PaymentStatus.COMPLETED
-    ).scalar() or 0
-    
-    revenue_this_month = db.session.query(func.sum(Order.total_amount)).filter(
-        func.date(Order.created_at) >= month_ago,
-        Order.payment_status == PaymentStatus.COMPLETED
-    ).scalar() or 0
-    
-    # Order status distribution
-    order_status_stats = db.session.query(
-        Order.status, func.count(Order.id)
-    ).group_by(Order.status).all()
-    
-    # Payment status distribution
-    payment_status_stats = db.session.query(
-        Order.payment_status, func.count(Order.id)
-    ).group_by(Order.payment_status).all()
+    completed = Order.payment_status == PaymentStatus.COMPLETED.value
+    
+    def orders_since(start):
+        return func.count(case((Order.created_at >= start, Order.id)))
+    
+    def revenue_since(start):
+        return func.coalesce(func.sum(case((and_(Order.created_at >= start, completed), Order.total_amount))), 0)
+    
+    # Totals, recent order counts and revenue in a single round trip
+    kpi_statement = select(
+        select(func.count(User.id)).scalar_subquery(),
+        select(func.count(Product.id)).where(Product.is_active == True).scalar_subquery(),
+        func.count(Order.id),
+        orders_since(today),
+        orders_since(week_ago),
+        orders_since(month_ago),
+        revenue_since(today),
+        revenue_since(week_ago),
+        revenue_since(month_ago)
+    ).select_from(Order)
+    
+    # Order and payment status distributions from one grouped query
+    status_statement = select(
+        Order.status, Order.payment_status, func.count(Order.id)
+    ).group_by(Order.status, Order.payment_status)
     
     # Top selling products
-    top_products = db.session.query(
+    top_products_statement = select(
         Product.name,
-        func.sum(Order.items.any()).label('total_sold')
-    ).join(Order.items).filter(
-        Order.payment_status == PaymentStatus.COMPLETED
-    ).group_by(Product.id, Product.name).order_by(desc('total_sold')).limit(5).all()
+        func.sum(OrderItem.quantity).label('total_sold')
+    ).join(OrderItem, OrderItem.product_id == Product.id).join(
+        Order, Order.id == OrderItem.order_id
+    ).where(
+        completed
+    ).group_by(Product.id, Product.name).order_by(desc('total_sold')).limit(5)
+    
+    # The aggregates are independent: run them concurrently while the low stock
+    # products (ORM objects, so they stay on the request session) load here
+    kpi_future = submit_query(kpi_statement)
+    status_future = submit_query(status_statement)
+    top_products_future = submit_query(top_products_statement)
     
     # Low stock products
     low_stock_products = Product.query.filter(
@@ -76,6 +96,20 @@ def get_dashboard_stats():
         Product.stock_quantity <= 10
     ).order_by(Product.stock_quantity).limit(10).all()
     
+    (
+        total_users, total_products, total_orders,
+        orders_today, orders_this_week, orders_this_month,
+        revenue_today, revenue_this_week, revenue_this_month
+    ) = kpi_future.result()[0]
+    
+    order_status_counts = {}
+    payment_status_counts = {}
+    for status, payment_status, count in status_future.result():
+        order_status_counts[status] = order_status_counts.get(status, 0) + count
+        payment_status_counts[payment_status] = payment_status_counts.get(payment_status, 0) + count
+    
+    top_products = top_products_future.result()
+    
     return jsonify({
         'totals': {
             'users': total_users,
@@ -88,17 +122,17 @@ def get_dashboard_stats():
             'this_month': orders_this_month
         },
         'revenue': {
-            'today': float(revenue_today),
-            'this_week': float(revenue_this_week),
-            'this_month': float(revenue_this_month)
+            'today': revenue_today,
+            'this_week': revenue_this_week,
+            'this_month': revenue_this_month
         },
         'order_status_distribution': [
-            {'status': status.value, 'count': count} 
-            for status, count in order_status_stats
+            {'status': status, 'count': count} 
+            for status, count in order_status_counts.items()
         ],
         'payment_status_distribution': [
-            {'status': status.value, 'count': count} 
-            for status, count in payment_status_stats
+            {'status': status, 'count': count} 
+            for status, count in payment_status_counts.items()
         ],
         'top_products': [
             {'name': name, 'total_sold': total_sold} 
@@ -150,10 +184,10 @@ def get_users():
     query = query.order_by(User.created_at.desc())
     
     # Paginate results
-    result = paginate_query(query, page=page, per_page=per_page)
+    result = paginate_query(query, page=page, per_page=per_page, only_columns=USER_LIST_COLUMNS)
     
     return jsonify({
-        'users': [user_response_schema.dump(user) for user in result['items']],
+        'users': user_response_schema.dump(result['items'], many=True),
         'pagination': {
             'total': result['total'],
             'page': result['page'],
@@ -197,6 +231,9 @@ def create_user():
             'user': user_response_schema.dump(user)
         }), 201
         
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Validation error', 'details': {'email': ['Email already registered.']}}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create user', 'details': str(e)}), 500
@@ -206,7 +243,7 @@ def create_user():
 @handle_errors
 def update_user(user_id):
     """Update user (Admin only)"""
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -233,6 +270,7 @@ def update_user(user_id):
     
     try:
         db.session.commit()
+        invalidate_user(user_id)
         
         return jsonify({
             'message': 'User updated successfully',
@@ -248,7 +286,7 @@ def update_user(user_id):
 @handle_errors
 def delete_user(user_id):
     """Deactivate user (Admin only)"""
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -262,6 +300,7 @@ def delete_user(user_id):
         # Soft delete - just deactivate
         user.is_active = False
         db.session.commit()
+        invalidate_user(user_id)
         
         return jsonify({
             'message': 'User deactivated successfully'
@@ -273,6 +312,7 @@ def delete_user(user_id):
 
 @admin_bp.route('/analytics', methods=['GET'])
 @admin_required
+@cache.cached(timeout=60, query_string=True, response_filter=cache_ok_only)
 @handle_errors
 def get_analytics():
     """Get detailed analytics"""
@@ -281,24 +321,27 @@ def get_analytics():
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=days)
     
+    # Filter on the raw column (index range scan); date() only appears in SELECT/GROUP BY
+    in_period = and_(
+        Order.created_at >= datetime.combine(start_date, time.min),
+        Order.payment_status == PaymentStatus.COMPLETED.value
+    )
+    order_date = func.date(Order.created_at, type_=db.Date)
+    
     # Daily sales data
     daily_sales = db.session.query(
-        func.date(Order.created_at).label('date'),
+        order_date.label('date'),
         func.count(Order.id).label('orders'),
         func.sum(Order.total_amount).label('revenue')
-    ).filter(
-        func.date(Order.created_at) >= start_date,
-        Order.payment_status == PaymentStatus.COMPLETED
-    ).group_by(func.date(Order.created_at)).order_by('date').all()
+    ).filter(in_period).group_by(order_date).order_by('date').all()
     
-    # Category performance
+    # Category performance (revenue from the category's own items, not whole orders)
     category_performance = db.session.query(
         Category.name,
-        func.count(Order.id).label('orders'),
-        func.sum(Order.total_amount).label('revenue')
-    ).join(Product).join(Order.items).join(Order).filter(
-        func.date(Order.created_at) >= start_date,
-        Order.payment_status == PaymentStatus.COMPLETED
+        func.count(func.distinct(Order.id)).label('orders'),
+        func.sum(OrderItem.quantity * OrderItem.price_at_time).label('revenue')
+    ).select_from(Category).join(Product).join(OrderItem).join(Order).filter(
+        in_period
     ).group_by(Category.id, Category.name).order_by(desc('revenue')).all()
     
     # Payment method distribution
@@ -306,22 +349,19 @@ def get_analytics():
         Order.payment_method,
         func.count(Order.id).label('count'),
         func.sum(Order.total_amount).label('revenue')
-    ).filter(
-        func.date(Order.created_at) >= start_date,
-        Order.payment_status == PaymentStatus.COMPLETED
-    ).group_by(Order.payment_method).all()
+    ).filter(in_period).group_by(Order.payment_method).all()
     
     return jsonify({
         'period': {
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
+            'start_date': start_date,
+            'end_date': end_date,
             'days': days
         },
         'daily_sales': [
             {
-                'date': date.isoformat(),
+                'date': date,
                 'orders': orders,
-                'revenue': float(revenue or 0)
+                'revenue': revenue
             }
             for date, orders, revenue in daily_sales
         ],
@@ -329,7 +369,7 @@ def get_analytics():
             {
                 'category': name,
                 'orders': orders,
-                'revenue': float(revenue or 0)
+                'revenue': revenue
             }
             for name, orders, revenue in category_performance
         ],
@@ -337,7 +377,7 @@ def get_analytics():
             {
                 'method': method,
                 'count': count,
-                'revenue': float(revenue or 0)
+                'revenue': revenue
             }
             for method, count, revenue in payment_methods
         ]
@@ -1,9 +1,12 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer
 from src.models.user import db, User
 from src.schemas.user_schema import UserRegistrationSchema, UserLoginSchema, UserResponseSchema
 from src.utils.decorators import validate_json, handle_errors
+from src.utils.cache import cache, cache_ok_only, current_user_cache_key
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -49,6 +52,10 @@ def register():
             'refresh_token': refresh_token
         }), 201
         
+    except IntegrityError:
+        # The unique email index rejects duplicates atomically, no lookup beforehand
+        db.session.rollback()
+        return jsonify({'error': 'Validation error', 'details': {'email': ['Email already registered.']}}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create user', 'details': str(e)}), 500
@@ -92,9 +99,9 @@ def login():
 def refresh():
     """Refresh access token"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    is_active = db.session.query(User.is_active).filter_by(id=current_user_id).scalar()
     
-    if not user or not user.is_active:
+    if not is_active:
         return jsonify({'error': 'User not found or inactive'}), 401
     
     # Create new access token
@@ -106,11 +113,13 @@ def refresh():
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
+@cache.cached(timeout=15, make_cache_key=current_user_cache_key, response_filter=cache_ok_only)
 @handle_errors
 def get_current_user():
     """Get current user information"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    # Everything the response needs, without the password hash
+    user = db.session.get(User, current_user_id, options=[defer(User.password_hash)])
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
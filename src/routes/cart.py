@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity
 from marshmallow import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from src.models.user import db
 from src.models.cart import Cart, CartItem
 from src.models.product import Product
@@ -14,14 +19,41 @@ add_to_cart_schema = AddToCartSchema()
 update_cart_item_schema = UpdateCartItemSchema()
 cart_response_schema = CartResponseSchema()
 
+def cart_query():
+    """Cart query with items, their products and categories eagerly loaded"""
+    return Cart.query.options(
+        selectinload(Cart.items).selectinload(CartItem.product).joinedload(Product.category)
+    )
+
 def get_or_create_cart(user_id):
-    """Get or create cart for user"""
-    cart = Cart.query.filter_by(user_id=user_id).first()
-    if not cart:
-        cart = Cart(user_id=user_id)
-        db.session.add(cart)
-        db.session.commit()
-    return cart
+    """Get or create cart for user; returns (cart, created) and leaves committing to the caller"""
+    cart = cart_query().filter_by(user_id=user_id).first()
+    if cart:
+        return cart, False
+    
+    # Concurrent first requests race here; the unique user_id makes the insert a no-op for the loser
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        upsert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        db.session.execute(
+            upsert(Cart).values(user_id=user_id).on_conflict_do_nothing(index_elements=['user_id'])
+        )
+    else:
+        # No ON CONFLICT DO NOTHING elsewhere (e.g. MySQL): insert in a savepoint so losing
+        # the race only rolls back the insert, then read the winner's cart
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Cart).values(user_id=user_id))
+        except IntegrityError:
+            pass
+    return cart_query().filter_by(user_id=user_id).one(), True
+
+def find_cart_item(cart, **criteria):
+    """Find an item in the cart's already loaded items collection"""
+    return next(
+        (item for item in cart.items if all(getattr(item, key) == value for key, value in criteria.items())),
+        None
+    )
 
 @cart_bp.route('/', methods=['GET'])
 @auth_required
@@ -29,7 +61,9 @@ def get_or_create_cart(user_id):
 def get_cart():
     """Get user's cart"""
     current_user_id = get_jwt_identity()
-    cart = get_or_create_cart(current_user_id)
+    cart, created = get_or_create_cart(current_user_id)
+    if created:
+        db.session.commit()
     
     return jsonify({
         'cart': cart.to_dict()
@@ -50,10 +84,13 @@ def add_to_cart():
         return jsonify({'error': 'Validation error', 'details': e.messages}), 400
     
     current_user_id = get_jwt_identity()
-    cart = get_or_create_cart(current_user_id)
+    cart, _ = get_or_create_cart(current_user_id)
+    
+    # Check if item already exists in cart (its product is already loaded with it)
+    existing_item = find_cart_item(cart, product_id=data['product_id'])
     
     # Get product
-    product = Product.query.get(data['product_id'])
+    product = existing_item.product if existing_item else db.session.get(Product, data['product_id'])
     if not product or not product.is_active:
         return jsonify({'error': 'Product not found or inactive'}), 404
     
@@ -61,12 +98,6 @@ def add_to_cart():
     if not product.is_in_stock(data['quantity']):
         return jsonify({'error': 'Insufficient stock'}), 400
     
-    # Check if item already exists in cart
-    existing_item = CartItem.query.filter_by(
-        cart_id=cart.id, 
-        product_id=data['product_id']
-    ).first()
-    
     if existing_item:
         # Update quantity
         new_quantity = existing_item.quantity + data['quantity']
@@ -76,20 +107,18 @@ def add_to_cart():
         existing_item.quantity = new_quantity
     else:
         # Create new cart item
-        cart_item = CartItem(
-            cart_id=cart.id,
+        cart.items.append(CartItem(
             product_id=data['product_id'],
             quantity=data['quantity'],
             price_at_time=product.price
-        )
-        db.session.add(cart_item)
+        ))
     
     try:
         db.session.commit()
         
         return jsonify({
             'message': 'Item added to cart successfully',
-            'cart': cart.to_dict()
+            'cart': cart_query().filter_by(user_id=current_user_id).one().to_dict()
         }), 200
         
     except Exception as e:
@@ -113,10 +142,8 @@ def update_cart_item(item_id):
     current_user_id = get_jwt_identity()
     
     # Get cart item
-    cart_item = CartItem.query.join(Cart).filter(
-        CartItem.id == item_id,
-        Cart.user_id == current_user_id
-    ).first()
+    cart = cart_query().filter_by(user_id=current_user_id).first()
+    cart_item = find_cart_item(cart, id=item_id) if cart else None
     
     if not cart_item:
         return jsonify({'error': 'Cart item not found'}), 404
@@ -133,7 +160,7 @@ def update_cart_item(item_id):
         
         return jsonify({
             'message': 'Cart item updated successfully',
-            'cart': cart_item.cart.to_dict()
+            'cart': cart_query().filter_by(user_id=current_user_id).one().to_dict()
         }), 200
         
     except Exception as e:
@@ -148,23 +175,19 @@ def remove_cart_item(item_id):
     current_user_id = get_jwt_identity()
     
     # Get cart item
-    cart_item = CartItem.query.join(Cart).filter(
-        CartItem.id == item_id,
-        Cart.user_id == current_user_id
-    ).first()
+    cart = cart_query().filter_by(user_id=current_user_id).first()
+    cart_item = find_cart_item(cart, id=item_id) if cart else None
     
     if not cart_item:
         return jsonify({'error': 'Cart item not found'}), 404
     
-    cart = cart_item.cart
-    
     try:
-        db.session.delete(cart_item)
+        cart.items.remove(cart_item)  # delete-orphan cascade deletes the row
         db.session.commit()
         
         return jsonify({
             'message': 'Item removed from cart successfully',
-            'cart': cart.to_dict()
+            'cart': cart_query().filter_by(user_id=current_user_id).one().to_dict()
         }), 200
         
     except Exception as e:
@@ -177,7 +200,7 @@ def remove_cart_item(item_id):
 def clear_cart():
     """Clear all items from cart"""
     current_user_id = get_jwt_identity()
-    cart = Cart.query.filter_by(user_id=current_user_id).first()
+    cart = cart_query().filter_by(user_id=current_user_id).first()
     
     if not cart:
         return jsonify({'message': 'Cart is already empty'}), 200
@@ -1,11 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import get_jwt_identity
 from marshmallow import ValidationError
+from sqlalchemy import bindparam, insert
+from sqlalchemy.orm import selectinload
+from datetime import datetime
 from src.models.user import db
-from src.models.cart import Cart, Order, OrderItem, OrderStatus, PaymentStatus
+from src.models.cart import Cart, CartItem, Order, OrderItem, OrderStatus, PaymentStatus
+from src.models.product import Product
 from src.schemas.order_schema import CreateOrderSchema, OrderResponseSchema
 from src.utils.decorators import auth_required, admin_required, handle_errors
-from src.utils.helpers import paginate_query, calculate_order_total
+from src.utils.helpers import paginate_query, keyset_paginate, row_cursor, calculate_order_total
+from src.utils.cache import invalidate_products, invalidate_dashboard
 
 orders_bp = Blueprint('orders', __name__)
 
@@ -13,6 +18,69 @@ orders_bp = Blueprint('orders', __name__)
 create_order_schema = CreateOrderSchema()
 order_response_schema = OrderResponseSchema()
 
+# Orders fetched per round trip while streaming the admin order list
+ORDER_STREAM_BATCH = 50
+
+# Newest first; the id breaks ties between orders created in the same instant
+ORDER_CURSOR_COLUMNS = [Order.created_at, Order.id]
+
+def order_query():
+    """Order query with items, their products and categories eagerly loaded"""
+    return Order.query.options(
+        selectinload(Order.items).joinedload(OrderItem.product).joinedload(Product.category)
+    )
+
+def paginate_orders(query, yield_per=None):
+    """Paginate an order query from the request args
+
+    ?after=<cursor> seeks past the last order seen (newest first) without OFFSET or
+    COUNT; ?page= keeps the legacy numbered pagination. Both return a next_cursor to
+    continue with ?after= (an empty ?after= starts from the newest order).
+    Raises ValueError for a bad cursor.
+    """
+    # Both paginators clamp per_page to 1..MAX_PER_PAGE
+    per_page = request.args.get('per_page', 20, type=int)
+    after = request.args.get('after')
+    
+    if after is not None:
+        result = keyset_paginate(query, ORDER_CURSOR_COLUMNS, after=after, per_page=per_page)
+        return result['items'], {
+            'per_page': result['per_page'],
+            'has_next': result['has_next'],
+            'next_cursor': result['next_cursor']
+        }
+    
+    page = request.args.get('page', 1, type=int)
+    result = paginate_query(
+        query.order_by(*(column.desc() for column in ORDER_CURSOR_COLUMNS)),
+        page=page, per_page=per_page, yield_per=yield_per
+    )
+    pagination = {
+        'total': result['total'],
+        'page': result['page'],
+        'per_page': result['per_page'],
+        'pages': result['pages'],
+        'has_prev': result['has_prev'],
+        'has_next': result['has_next'],
+        'next_cursor': None
+    }
+    items = result['items']
+    if not result['has_next']:
+        return items, pagination
+    if yield_per:
+        # Streamed: the last order is only known once the response body has been written
+        return _set_next_cursor(items, pagination), pagination
+    pagination['next_cursor'] = row_cursor(items[-1], ORDER_CURSOR_COLUMNS)
+    return items, pagination
+
+def _set_next_cursor(orders, pagination):
+    """Pass orders through, then store the cursor past the last one in pagination"""
+    order = None
+    for order in orders:
+        yield order
+    if order is not None:
+        pagination['next_cursor'] = row_cursor(order, ORDER_CURSOR_COLUMNS)
+
 @orders_bp.route('/', methods=['GET'])
 @auth_required
 @handle_errors
@@ -20,26 +88,18 @@ def get_user_orders():
     """Get user's orders"""
     current_user_id = get_jwt_identity()
     
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
-    
     # Query user's orders
-    query = Order.query.filter_by(user_id=current_user_id).order_by(Order.created_at.desc())
+    query = order_query().filter_by(user_id=current_user_id)
     
     # Paginate results
-    result = paginate_query(query, page=page, per_page=per_page)
+    try:
+        orders, pagination = paginate_orders(query)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'orders': [order.to_dict() for order in result['items']],
-        'pagination': {
-            'total': result['total'],
-            'page': result['page'],
-            'per_page': result['per_page'],
-            'pages': result['pages'],
-            'has_prev': result['has_prev'],
-            'has_next': result['has_next']
-        }
+        'orders': order_response_schema.dump(orders, many=True),
+        'pagination': pagination
     }), 200
 
 @orders_bp.route('/<int:order_id>', methods=['GET'])
@@ -49,7 +109,7 @@ def get_order(order_id):
     """Get order details"""
     current_user_id = get_jwt_identity()
     
-    order = Order.query.filter_by(id=order_id, user_id=current_user_id).first()
+    order = order_query().filter_by(id=order_id, user_id=current_user_id).first()
     
     if not order:
         return jsonify({'error': 'Order not found'}), 404
@@ -74,17 +134,26 @@ def create_order():
     
     current_user_id = get_jwt_identity()
     
-    # Get user's cart
-    cart = Cart.query.filter_by(user_id=current_user_id).first()
+    # Get user's cart (its products are loaded below, locked, in a single query)
+    cart = Cart.query.options(
+        selectinload(Cart.items).lazyload(CartItem.product)
+    ).filter_by(user_id=current_user_id).first()
     
     if not cart or not cart.items:
         return jsonify({'error': 'Cart is empty'}), 400
     
-    # Check stock availability for all items
+    # Lock all products in the cart and check stock availability in memory
+    products = {
+        product.id: product
+        for product in Product.query.filter(
+            Product.id.in_([item.product_id for item in cart.items])
+        ).with_for_update().populate_existing()
+    }
     for item in cart.items:
-        if not item.product.is_in_stock(item.quantity):
+        product = products[item.product_id]
+        if not product.is_in_stock(item.quantity):
             return jsonify({
-                'error': f'Insufficient stock for product: {item.product.name}'
+                'error': f'Insufficient stock for product: {product.name}'
             }), 400
     
     # Calculate order totals
@@ -113,26 +182,35 @@ def create_order():
         db.session.add(order)
         db.session.flush()  # Get order ID
         
-        # Create order items and reduce stock
-        for cart_item in cart.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                price_at_time=cart_item.price_at_time,
-                product_name=cart_item.product.name,
-                product_sku=cart_item.product.sku,
-                product_image=cart_item.product.get_main_image()
-            )
-            db.session.add(order_item)
-            
-            # Reduce stock
-            cart_item.product.reduce_stock(cart_item.quantity)
+        # Create order items in a single multi-row INSERT
+        db.session.execute(insert(OrderItem), [
+            {
+                'order_id': order.id,
+                'product_id': cart_item.product_id,
+                'quantity': cart_item.quantity,
+                'price_at_time': cart_item.price_at_time,
+                'product_name': products[cart_item.product_id].name,
+                'product_sku': products[cart_item.product_id].sku,
+                'product_image': products[cart_item.product_id].get_main_image()
+            }
+            for cart_item in cart.items
+        ])
+        
+        # Reduce stock for all products in one executemany UPDATE
+        products_table = Product.__table__
+        db.session.execute(
+            products_table.update()
+            .where(products_table.c.id == bindparam('product_id'))
+            .values(stock_quantity=products_table.c.stock_quantity - bindparam('quantity')),
+            [{'product_id': item.product_id, 'quantity': item.quantity} for item in cart.items]
+        )
         
         # Clear cart
         cart.clear()
         
         db.session.commit()
+        invalidate_products()  # Stock levels changed
+        invalidate_dashboard()
         
         return jsonify({
             'message': 'Order created successfully',
@@ -161,6 +239,8 @@ def cancel_order(order_id):
     try:
         order.cancel()
         db.session.commit()
+        invalidate_products()  # Stock levels changed
+        invalidate_dashboard()
         
         return jsonify({
             'message': 'Order cancelled successfully',
@@ -177,47 +257,44 @@ def cancel_order(order_id):
 @handle_errors
 def get_all_orders():
     """Get all orders (Admin only)"""
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
-    
     # Get filter parameters
     status = request.args.get('status')
     payment_status = request.args.get('payment_status')
     
     # Build query
-    query = Order.query
+    query = order_query()
     
     if status:
         try:
             status_enum = OrderStatus(status)
-            query = query.filter_by(status=status_enum)
+            query = query.filter_by(status=status_enum.value)
         except ValueError:
             return jsonify({'error': 'Invalid status'}), 400
     
     if payment_status:
         try:
             payment_status_enum = PaymentStatus(payment_status)
-            query = query.filter_by(payment_status=payment_status_enum)
+            query = query.filter_by(payment_status=payment_status_enum.value)
         except ValueError:
             return jsonify({'error': 'Invalid payment status'}), 400
     
-    query = query.order_by(Order.created_at.desc())
+    # Paginate results, fetching page-based rows in batches as the response is written
+    try:
+        orders, pagination = paginate_orders(query, yield_per=ORDER_STREAM_BATCH)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Paginate results
-    result = paginate_query(query, page=page, per_page=per_page)
+    # Same body as jsonify({'orders': [...], 'pagination': {...}}), without building the list first
+    def generate():
+        dumps = current_app.json.dumps
+        yield '{"orders":['
+        for index, order in enumerate(orders):
+            if index:
+                yield ','
+            yield dumps(order_response_schema.dump(order))
+        yield '],"pagination":' + dumps(pagination) + '}'
     
-    return jsonify({
-        'orders': [order.to_dict() for order in result['items']],
-        'pagination': {
-            'total': result['total'],
-            'page': result['page'],
-            'per_page': result['per_page'],
-            'pages': result['pages'],
-            'has_prev': result['has_prev'],
-            'has_next': result['has_next']
-        }
-    }), 200
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json'), 200
 
 @orders_bp.route('/admin/<int:order_id>/status', methods=['PUT'])
 @admin_required
@@ -227,7 +304,7 @@ def update_order_status(order_id):
     if not request.is_json:
         return jsonify({'error': 'Content-Type must be application/json'}), 400
     
-    order = Order.query.get(order_id)
+    order = db.session.get(Order, order_id)
     
     if not order:
         return jsonify({'error': 'Order not found'}), 404
@@ -244,10 +321,8 @@ def update_order_status(order_id):
         
         # Update timestamps
         if status_enum == OrderStatus.SHIPPED:
-            from datetime import datetime
             order.shipped_at = datetime.utcnow()
         elif status_enum == OrderStatus.DELIVERED:
-            from datetime import datetime
             order.delivered_at = datetime.utcnow()
         
         db.session.commit()
@@ -1,19 +1,35 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity
 from marshmallow import ValidationError
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from src.models.user import db
-from src.models.cart import Order, PaymentStatus
+from src.models.cart import Order, PaymentStatus, PAYMENT_STATUS_SOURCES, StripeEvent, StripeEventStatus
 from src.schemas.order_schema import PaymentIntentSchema, ConfirmPaymentSchema
 from src.services.payment_service import PaymentService
-from src.utils.decorators import auth_required, handle_errors
+from src.celery_app import process_stripe_event, WEBHOOK_PAYMENT_STATUSES
+from src.utils.decorators import auth_required, handle_errors, conditional_etag, require_json_body
+from src.utils.cache import cache, cache_ok_only, PAYMENT_METHODS_KEY
 
 payments_bp = Blueprint('payments', __name__)
+# Stripe signs the raw webhook payload; its signature is checked on the bytes before parsing
+payments_bp.before_request(require_json_body('payments.stripe_webhook'))
+
+# PaymentIntent statuses that settle an order; the rest (processing, requires_confirmation,
+# requires_capture) leave it pending until the webhook reports the outcome
+CONFIRM_PAYMENT_STATUSES = {
+    'succeeded': PaymentStatus.COMPLETED,
+    'requires_payment_method': PaymentStatus.FAILED,
+    'canceled': PaymentStatus.FAILED
+}
 
 # Schema instances
 payment_intent_schema = PaymentIntentSchema()
 confirm_payment_schema = ConfirmPaymentSchema()
 
 @payments_bp.route('/methods', methods=['GET'])
+@conditional_etag
+@cache.cached(key_prefix=PAYMENT_METHODS_KEY, response_filter=cache_ok_only)
 @handle_errors
 def get_payment_methods():
     """Get available payment methods"""
@@ -28,9 +44,6 @@ def get_payment_methods():
 @handle_errors
 def create_payment_intent():
     """Create payment intent"""
-    if not request.is_json:
-        return jsonify({'error': 'Content-Type must be application/json'}), 400
-    
     try:
         # Validate input data
         data = payment_intent_schema.load(request.get_json())
@@ -58,13 +71,27 @@ def create_payment_intent():
             payment_method=data['payment_method']
         )
         
-        # Update order with payment intent ID
-        order.stripe_payment_intent_id = intent_data['payment_intent_id']
-        order.payment_method = data['payment_method']
+        # Update order with payment intent ID and totals with fees, in one UPDATE
+        # that only matches while the payment is still pending
+        updated_id = db.session.execute(
+            update(Order)
+            .where(
+                Order.id == order.id,
+                Order.user_id == current_user_id,
+                Order.payment_status == PaymentStatus.PENDING.value
+            )
+            .values(
+                stripe_payment_intent_id=intent_data['payment_intent_id'],
+                payment_method=data['payment_method'],
+                tax_amount=intent_data['fee_breakdown']['total_fee'],
+                total_amount=intent_data['amount']
+            )
+            .returning(Order.id)
+        ).scalar()
         
-        # Update order totals with fees
-        order.tax_amount = intent_data['fee_breakdown']['total_fee']
-        order.total_amount = intent_data['amount']
+        if updated_id is None:
+            db.session.rollback()
+            return jsonify({'error': 'Order payment is not pending'}), 400
         
         db.session.commit()
         
@@ -85,9 +112,6 @@ def create_payment_intent():
 @handle_errors
 def confirm_payment():
     """Confirm payment"""
-    if not request.is_json:
-        return jsonify({'error': 'Content-Type must be application/json'}), 400
-    
     try:
         # Validate input data
         data = confirm_payment_schema.load(request.get_json())
@@ -112,23 +136,34 @@ def confirm_payment():
             payment_method_id=data.get('payment_method_id')
         )
         
-        # Update order payment status based on Stripe response
-        if payment_result['status'] == 'succeeded':
-            order.payment_status = PaymentStatus.COMPLETED
-        elif payment_result['status'] == 'requires_action':
+        if payment_result['status'] == 'requires_action':
             # Payment requires additional action (3D Secure, etc.)
             return jsonify({
                 'requires_action': True,
                 'payment_intent_id': data['payment_intent_id'],
                 'status': payment_result['status']
             }), 200
-        else:
-            order.payment_status = PaymentStatus.FAILED
         
-        db.session.commit()
+        # Update order payment status based on Stripe response, unless the
+        # webhook already settled it
+        new_status = CONFIRM_PAYMENT_STATUSES.get(payment_result['status'])
+        if new_status is not None:
+            db.session.execute(
+                update(Order)
+                .where(Order.id == order.id, Order.payment_status.in_(PAYMENT_STATUS_SOURCES[new_status]))
+                .values(payment_status=new_status.value)
+            )
+            db.session.commit()
+        
+        if new_status == PaymentStatus.COMPLETED:
+            message = 'Payment processed successfully'
+        elif new_status == PaymentStatus.FAILED:
+            message = 'Payment failed'
+        else:
+            message = 'Payment is being processed'
         
         return jsonify({
-            'message': 'Payment processed successfully',
+            'message': message,
             'status': payment_result['status'],
             'order': order.to_dict()
         }), 200
@@ -147,45 +182,43 @@ def stripe_webhook():
     try:
         # Verify webhook signature
         event = PaymentService.handle_webhook(payload, signature)
-        
-        # Handle different event types
-        if event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            
-            # Find order by payment intent ID
-            order = Order.query.filter_by(
-                stripe_payment_intent_id=payment_intent['id']
-            ).first()
-            
-            if order:
-                order.payment_status = PaymentStatus.COMPLETED
-                db.session.commit()
-        
-        elif event['type'] == 'payment_intent.payment_failed':
-            payment_intent = event['data']['object']
-            
-            # Find order by payment intent ID
-            order = Order.query.filter_by(
-                stripe_payment_intent_id=payment_intent['id']
-            ).first()
-            
-            if order:
-                order.payment_status = PaymentStatus.FAILED
-                db.session.commit()
-        
-        return jsonify({'status': 'success'}), 200
-        
     except Exception as e:
         return jsonify({'error': 'Webhook processing failed', 'details': str(e)}), 400
+    
+    # Record the event once (Stripe redelivers on timeouts and retries), then acknowledge
+    # right away; the order update runs on a Celery worker
+    handled = event['type'] in WEBHOOK_PAYMENT_STATUSES
+    db.session.add(StripeEvent(
+        id=event['id'],
+        type=event['type'],
+        payload=request.get_json(force=True),
+        status=(StripeEventStatus.UNPROCESSED if handled else StripeEventStatus.IGNORED).value
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # A redelivery; enqueue it again if the first attempt never reached a worker
+        # (the task skips events that are no longer unprocessed)
+        stored = db.session.get(StripeEvent, event['id'])
+        if stored is None or stored.status != StripeEventStatus.UNPROCESSED.value:
+            return jsonify({'status': 'duplicate'}), 200
+    
+    if handled:
+        try:
+            process_stripe_event.delay(event['id'])
+        except Exception as e:
+            # The event stays unprocessed; a 5xx makes Stripe redeliver it
+            return jsonify({'error': 'Webhook processing failed', 'details': str(e)}), 503
+        return jsonify({'status': 'queued'}), 200
+    
+    return jsonify({'status': 'success'}), 200
 
 @payments_bp.route('/refund', methods=['POST'])
 @auth_required
 @handle_errors
 def create_refund():
     """Create refund for order"""
-    if not request.is_json:
-        return jsonify({'error': 'Content-Type must be application/json'}), 400
-    
     data = request.get_json()
     order_id = data.get('order_id')
     amount = data.get('amount')  # Optional partial refund
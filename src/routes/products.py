@@ -1,26 +1,56 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 from marshmallow import ValidationError
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only
 from src.models.user import db
 from src.models.product import Product, Category
 from src.schemas.product_schema import (
-    ProductCreateSchema, ProductUpdateSchema, ProductResponseSchema, 
-    ProductSearchSchema, CategorySchema
+    ProductCreateSchema, ProductBulkCreateSchema, ProductUpdateSchema, ProductResponseSchema, 
+    ProductSearchSchema, ProductCardSchema, CategorySchema
+)
+from src.utils.decorators import admin_required, handle_errors, conditional_etag, require_json_body
+from src.utils.helpers import paginate_query, keyset_paginate, row_cursor
+from src.utils.cache import (
+    cache, cache_ok_only, products_cache_key, products_generation, invalidate_products,
+    invalidate_categories, CATEGORIES_KEY
 )
-from src.utils.decorators import admin_required, handle_errors
-from src.utils.helpers import paginate_query
 
 products_bp = Blueprint('products', __name__)
+products_bp.before_request(require_json_body())
 
 # Schema instances
 product_create_schema = ProductCreateSchema()
+product_bulk_create_schema = ProductBulkCreateSchema()
 product_update_schema = ProductUpdateSchema()
 product_response_schema = ProductResponseSchema()
 product_search_schema = ProductSearchSchema()
+product_card_schema = ProductCardSchema()
 category_schema = CategorySchema()
 
+# Columns update_product may write (table columns are fixed at import)
+PRODUCT_COLUMNS = frozenset(Product.__table__.columns.keys())
+
+# Listing order: featured first, then by name (id breaks ties)
+PRODUCT_CURSOR_COLUMNS = [Product.is_featured, Product.name, Product.id]
+PRODUCT_CURSOR_DESCENDING = (True, False, False)
+
+# Search args of the plain storefront listing (the homepage), after schema defaults
+DEFAULT_LISTING_ARGS = {'in_stock_only': True, 'page': 1, 'per_page': 20}
+
+def product_list_cache_key(*args, **kwargs):
+    """Cache key for product listings; every spelling of the default listing shares one entry"""
+    try:
+        if product_search_schema.load(request.args) == DEFAULT_LISTING_ARGS:
+            return f"products:{products_generation()}:featured"
+    except ValidationError:
+        pass
+    return products_cache_key()
+
 # Public routes
 @products_bp.route('/', methods=['GET'])
+@cache.cached(make_cache_key=product_list_cache_key, response_filter=cache_ok_only)
 @handle_errors
 def get_products():
     """Get products with search and filters"""
@@ -40,8 +70,46 @@ def get_products():
         in_stock_only=args.get('in_stock_only', True)
     )
     
-    # Order by featured first, then by name
-    query = query.order_by(Product.is_featured.desc(), Product.name)
+    # Load only the card columns, with each product's category in the same SELECT
+    query = query.options(
+        load_only(
+            Product.id, Product.name, Product.price, Product.category_id, Product.brand,
+            Product.stock_quantity, Product.images, Product.is_featured
+        ),
+        joinedload(Product.category).load_only(Category.id, Category.name)
+    )
+    
+    # Seek past the last product seen in listing order
+    if 'after' in args:
+        try:
+            result = keyset_paginate(
+                query,
+                PRODUCT_CURSOR_COLUMNS,
+                after=args['after'],
+                per_page=args.get('per_page', 20),
+                descending=PRODUCT_CURSOR_DESCENDING
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'products': product_card_schema.dump(result['items'], many=True),
+            'pagination': {
+                'per_page': result['per_page'],
+                'has_next': result['has_next'],
+                'next_cursor': result['next_cursor']
+            }
+        }), 200
+    
+    # Order by relevance when searching full-text, then in listing order
+    ordering = [
+        column.desc() if desc else column.asc()
+        for column, desc in zip(PRODUCT_CURSOR_COLUMNS, PRODUCT_CURSOR_DESCENDING)
+    ]
+    ranked = bool(args.get('query')) and db.engine.dialect.name == 'postgresql'
+    if ranked:
+        ordering.insert(0, db.desc(Product.search_rank(args['query'])))
+    query = query.order_by(*ordering)
     
     # Paginate results
     result = paginate_query(
@@ -51,22 +119,28 @@ def get_products():
     )
     
     return jsonify({
-        'products': [product_response_schema.dump(product) for product in result['items']],
+        'products': product_card_schema.dump(result['items'], many=True),
         'pagination': {
             'total': result['total'],
             'page': result['page'],
             'per_page': result['per_page'],
             'pages': result['pages'],
             'has_prev': result['has_prev'],
-            'has_next': result['has_next']
+            'has_next': result['has_next'],
+            # Continue with ?after=; relevance order has no cursor, so ranked searches page only
+            'next_cursor': (
+                row_cursor(result['items'][-1], PRODUCT_CURSOR_COLUMNS)
+                if result['has_next'] and not ranked else None
+            )
         }
     }), 200
 
 @products_bp.route('/<int:product_id>', methods=['GET'])
+@cache.cached(make_cache_key=products_cache_key, response_filter=cache_ok_only)
 @handle_errors
 def get_product(product_id):
     """Get single product by ID"""
-    product = Product.query.get(product_id)
+    product = db.session.get(Product, product_id, options=[joinedload(Product.category)])
     
     if not product or not product.is_active:
         return jsonify({'error': 'Product not found'}), 404
@@ -76,13 +150,15 @@ def get_product(product_id):
     }), 200
 
 @products_bp.route('/categories', methods=['GET'])
+@conditional_etag
+@cache.cached(key_prefix=CATEGORIES_KEY, response_filter=cache_ok_only)
 @handle_errors
 def get_categories():
     """Get all active categories"""
     categories = Category.query.filter_by(is_active=True).order_by(Category.name).all()
     
     return jsonify({
-        'categories': [category_schema.dump(category) for category in categories]
+        'categories': category_schema.dump(categories, many=True)
     }), 200
 
 # Admin routes
@@ -91,9 +167,6 @@ def get_categories():
 @handle_errors
 def create_product():
     """Create new product (Admin only)"""
-    if not request.is_json:
-        return jsonify({'error': 'Content-Type must be application/json'}), 400
-    
     try:
         # Validate input data
         data = product_create_schema.load(request.get_json())
@@ -121,48 +194,125 @@ def create_product():
     try:
         db.session.add(product)
         db.session.commit()
+        invalidate_products()
         
         return jsonify({
             'message': 'Product created successfully',
             'product': product_response_schema.dump(product)
         }), 201
         
+    except IntegrityError:
+        # The unique SKU index and the category foreign key are checked by the INSERT itself;
+        # only on failure look up which one it was
+        db.session.rollback()
+        if db.session.query(Product.id).filter_by(sku=data['sku']).first():
+            details = {'sku': ['SKU already exists.']}
+        else:
+            details = {'category_id': ['Category does not exist.']}
+        return jsonify({'error': 'Validation error', 'details': details}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create product', 'details': str(e)}), 500
 
-@products_bp.route('/<int:product_id>', methods=['PUT'])
+def bulk_product_errors(items):
+    """Per-item errors for unknown categories and taken SKUs, found with one query each"""
+    category_ids = {item['category_id'] for item in items}
+    known_categories = set(db.session.scalars(select(Category.id).where(Category.id.in_(category_ids))))
+    taken_skus = set(db.session.scalars(select(Product.sku).where(Product.sku.in_([item['sku'] for item in items]))))
+    
+    errors = {}
+    for index, item in enumerate(items):
+        item_errors = {}
+        if item['category_id'] not in known_categories:
+            item_errors['category_id'] = ['Category does not exist.']
+        if item['sku'] in taken_skus:
+            item_errors['sku'] = ['SKU already exists.']
+        if item_errors:
+            errors[index] = item_errors
+    return errors
+
+@products_bp.route('/bulk', methods=['POST'])
 @admin_required
 @handle_errors
-def update_product(product_id):
-    """Update product (Admin only)"""
-    product = Product.query.get(product_id)
+def bulk_create_products():
+    """Create several products at once (Admin only)"""
+    try:
+        # Validate input data
+        items = product_bulk_create_schema.load(request.get_json())['items']
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': e.messages}), 400
     
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
+    errors = bulk_product_errors(items)
+    if errors:
+        return jsonify({'error': 'Validation error', 'details': {'items': errors}}), 400
     
-    if not request.is_json:
-        return jsonify({'error': 'Content-Type must be application/json'}), 400
+    # Same columns on every row so the INSERTs go out as one batch
+    products = [
+        Product(**{field: item.get(field) for field in product_create_schema.load_fields})
+        for item in items
+    ]
     
+    try:
+        db.session.add_all(products)
+        db.session.flush()
+        product_ids = [product.id for product in products]
+        db.session.commit()
+        invalidate_products()
+        
+        return jsonify({
+            'message': f'{len(product_ids)} products created successfully',
+            'product_ids': product_ids
+        }), 201
+        
+    except IntegrityError:
+        # A category or SKU changed since the check; report it the same way
+        db.session.rollback()
+        return jsonify({'error': 'Validation error', 'details': {'items': bulk_product_errors(items)}}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create products', 'details': str(e)}), 500
+
+@products_bp.route('/<int:product_id>', methods=['PUT'])
+@admin_required
+@handle_errors
+def update_product(product_id):
+    """Update product (Admin only)"""
     try:
         # Validate input data
         data = product_update_schema.load(request.get_json())
     except ValidationError as e:
         return jsonify({'error': 'Validation error', 'details': e.messages}), 400
     
-    # Update product fields
-    for field, value in data.items():
-        if hasattr(product, field):
-            setattr(product, field, value)
+    values = {field: value for field, value in data.items() if field in PRODUCT_COLUMNS}
     
     try:
+        # One UPDATE statement instead of per-attribute change tracking
+        if values:
+            result = db.session.execute(
+                update(Product).where(Product.id == product_id).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            found = result.rowcount > 0
+        else:
+            found = db.session.get(Product, product_id) is not None
+        
+        if not found:
+            db.session.rollback()
+            return jsonify({'error': 'Product not found'}), 404
+        
         db.session.commit()
+        invalidate_products()
         
+        product = db.session.get(Product, product_id, options=[joinedload(Product.category)])
         return jsonify({
             'message': 'Product updated successfully',
             'product': product_response_schema.dump(product)
         }), 200
         
+    except IntegrityError:
+        # category_id is the only constrained field the update schema accepts
+        db.session.rollback()
+        return jsonify({'error': 'Validation error', 'details': {'category_id': ['Category does not exist.']}}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update product', 'details': str(e)}), 500
@@ -172,7 +322,7 @@ def update_product(product_id):
 @handle_errors
 def delete_product(product_id):
     """Delete product (Admin only)"""
-    product = Product.query.get(product_id)
+    product = db.session.get(Product, product_id)
     
     if not product:
         return jsonify({'error': 'Product not found'}), 404
@@ -181,6 +331,7 @@ def delete_product(product_id):
         # Soft delete - just mark as inactive
         product.is_active = False
         db.session.commit()
+        invalidate_products()
         
         return jsonify({
             'message': 'Product deleted successfully'
@@ -195,9 +346,6 @@ def delete_product(product_id):
 @handle_errors
 def create_category():
     """Create new category (Admin only)"""
-    if not request.is_json:
-        return jsonify({'error': 'Content-Type must be application/json'}), 400
-    
     try:
         # Validate input data
         data = category_schema.load(request.get_json())
@@ -215,6 +363,7 @@ def create_category():
     try:
         db.session.add(category)
         db.session.commit()
+        invalidate_categories()
         
         return jsonify({
             'message': 'Category created successfully',
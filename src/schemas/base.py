@@ -0,0 +1,116 @@
+from datetime import datetime
+from decimal import Decimal
+from marshmallow import Schema, ValidationError, fields, missing, validate, validates_schema
+
+def _passthrough_types(field):
+    """Value types this field would dump unchanged (as far as the JSON output goes), or None
+
+    Model values of these exact types are emitted as-is; the orjson provider
+    encodes datetimes and Decimals itself.
+    """
+    field_type = type(field)
+    if field_type in (fields.Integer, fields.Decimal):
+        if field.as_string or getattr(field, 'places', None) is not None:
+            return None
+        return (int,) if field_type is fields.Integer else (Decimal,)
+    if field_type is fields.String:
+        return (str,)
+    if field_type is fields.Boolean:
+        return (bool,)
+    if field_type is fields.DateTime:
+        return (datetime,) if field.format in (None, 'iso') else None
+    if field_type is fields.Dict:
+        return (dict,) if field.key_field is None and field.value_field is None else None
+    if field_type is fields.List:
+        return (list,) if _passthrough_types(field.inner) == (str,) else None
+    return None
+
+class ModelSchema(Schema):
+    """Schema dumped from ORM instances through a compiled serializer.
+
+    The stock serializer goes through Field.serialize -> Field.get_value ->
+    utils.get_value (dotted paths, dict lookups) for every field of every row.
+    Model attributes only need a getattr and the field's own conversion, so the
+    first dump generates a straight-line function for the schema instance: one
+    getattr per field, with the conversion skipped entirely where the value
+    already has the type the field would produce.
+    Fields must map to plain attributes (no dotted ``attribute=`` paths);
+    Method/Function fields are passed the object itself.
+    """
+
+    _serializer = None
+
+    def _compile_serializer(self):
+        """Generate the dump function for this instance's fields"""
+        namespace = {'missing': missing, 'dict_class': self.dict_class}
+        lines = ['def serialize(obj):', '    ret = dict_class()']
+
+        for index, (name, field) in enumerate(self.dump_fields.items()):
+            key = field.data_key or name
+            serialize = f'field_{index}._serialize'
+            namespace[f'field_{index}'] = field
+
+            if not field._CHECK_ATTRIBUTE:
+                lines.append(f'    ret[{key!r}] = {serialize}(None, {name!r}, obj)')
+                continue
+
+            lines.append(f'    value = getattr(obj, {(field.attribute or name)!r}, missing)')
+            if field.dump_default is not missing:
+                namespace[f'default_{index}'] = field.dump_default
+                default = f'default_{index}()' if callable(field.dump_default) else f'default_{index}'
+                lines.append(f'    if value is missing: value = {default}')
+            converted = f'{serialize}(value, {name!r}, obj)'
+            passthrough = _passthrough_types(field)
+            if passthrough is not None:
+                namespace[f'types_{index}'] = passthrough
+                converted = f'value if value is None or value.__class__ in types_{index} else {converted}'
+            lines.append(f'    if value is not missing: ret[{key!r}] = {converted}')
+
+        lines.append('    return ret')
+        exec('\n'.join(lines), namespace)
+        return namespace['serialize']
+
+    def _serialize(self, obj, *, many=False):
+        serializer = self._serializer
+        if serializer is None:
+            serializer = self._serializer = self._compile_serializer()
+
+        if many and obj is not None:
+            return [serializer(item) for item in obj]
+        return serializer(obj)
+
+class LengthBoundsSchema(Schema):
+    """Schema whose string length limits are checked together in one schema validator.
+
+    ``length_bounds`` holds (field, min, max) tuples, None meaning unbounded on
+    that side; it replaces a validate.Length per field and reports the same
+    messages. Runs only once every field has loaded without errors.
+    """
+
+    length_bounds = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._length_checks = tuple(
+            (
+                name,
+                0 if low is None else low,
+                float('inf') if high is None else high,
+                (
+                    validate.Length.message_max if low is None
+                    else validate.Length.message_min if high is None
+                    else validate.Length.message_all
+                ).format(min=low, max=high)
+            )
+            for name, low, high in cls.length_bounds
+        )
+
+    @validates_schema(skip_on_field_errors=True)
+    def validate_length_bounds(self, data, **kwargs):
+        errors = {}
+        for name, low, high, message in self._length_checks:
+            value = data.get(name)
+            if value is not None and not low <= len(value) <= high:
+                errors[name] = [message]
+        if errors:
+            raise ValidationError(errors)
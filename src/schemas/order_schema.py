@@ -1,39 +1,64 @@
-from marshmallow import Schema, fields, validate, validates, ValidationError
+from marshmallow import EXCLUDE, Schema, fields, validate
 from src.models.cart import OrderStatus, PaymentStatus
-from src.models.product import Product
+from src.schemas.base import ModelSchema, LengthBoundsSchema
+from src.schemas.product_schema import ProductResponseSchema
 
 class AddToCartSchema(Schema):
     product_id = fields.Int(required=True)
     quantity = fields.Int(required=True, validate=validate.Range(min=1))
 
-    @validates('product_id')
-    def validate_product_exists(self, value):
-        product = Product.query.get(value)
-        if not product:
-            raise ValidationError('Product does not exist.')
-        if not product.is_active:
-            raise ValidationError('Product is not available.')
-
 class UpdateCartItemSchema(Schema):
     quantity = fields.Int(required=True, validate=validate.Range(min=1))
 
-class AddressSchema(Schema):
-    street = fields.Str(required=True, validate=validate.Length(min=1, max=200))
-    number = fields.Str(required=True, validate=validate.Length(min=1, max=20))
-    complement = fields.Str(required=False, validate=validate.Length(max=100))
-    neighborhood = fields.Str(required=True, validate=validate.Length(min=1, max=100))
-    city = fields.Str(required=True, validate=validate.Length(min=1, max=100))
-    state = fields.Str(required=True, validate=validate.Length(min=2, max=2))
-    zip_code = fields.Str(required=True, validate=validate.Length(min=8, max=9))
-    country = fields.Str(required=False, load_default='BR', validate=validate.Length(min=2, max=2))
+class AddressSchema(LengthBoundsSchema):
+    class Meta:
+        unknown = EXCLUDE
+
+    street = fields.Str(required=True)
+    number = fields.Str(required=True)
+    complement = fields.Str(required=False)
+    neighborhood = fields.Str(required=True)
+    city = fields.Str(required=True)
+    state = fields.Str(required=True)
+    zip_code = fields.Str(required=True)
+    country = fields.Str(required=False, load_default='BR')
+
+    length_bounds = (
+        ('street', 1, 200),
+        ('number', 1, 20),
+        ('complement', None, 100),
+        ('neighborhood', 1, 100),
+        ('city', 1, 100),
+        ('state', 2, 2),
+        ('zip_code', 8, 9),
+        ('country', 2, 2)
+    )
 
 class CreateOrderSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     shipping_address = fields.Nested(AddressSchema, required=True)
     billing_address = fields.Nested(AddressSchema, required=False)
     payment_method = fields.Str(required=True, validate=validate.OneOf(['credit_card', 'debit_card', 'pix', 'boleto']))
     notes = fields.Str(required=False)
 
-class OrderResponseSchema(Schema):
+class OrderItemResponseSchema(ModelSchema):
+    id = fields.Int()
+    order_id = fields.Int()
+    product_id = fields.Int()
+    product = fields.Nested(ProductResponseSchema, exclude=('stock_quantity',))
+    quantity = fields.Int()
+    price_at_time = fields.Decimal()
+    subtotal = fields.Method('get_subtotal')
+    product_name = fields.Str()
+    product_sku = fields.Str()
+    product_image = fields.Str()
+
+    def get_subtotal(self, item):
+        return item.get_subtotal()
+
+class OrderResponseSchema(ModelSchema):
     id = fields.Int()
     user_id = fields.Int()
     order_number = fields.Str()
@@ -47,7 +72,7 @@ class OrderResponseSchema(Schema):
     shipping_address = fields.Dict()
     billing_address = fields.Dict()
     notes = fields.Str()
-    items = fields.List(fields.Dict())
+    items = fields.Nested(OrderItemResponseSchema, many=True)
     created_at = fields.DateTime()
     updated_at = fields.DateTime()
     shipped_at = fields.DateTime()
@@ -66,10 +91,16 @@ class CartResponseSchema(Schema):
     updated_at = fields.DateTime()
 
 class PaymentIntentSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     order_id = fields.Int(required=True)
     payment_method = fields.Str(required=True, validate=validate.OneOf(['credit_card', 'debit_card', 'pix', 'boleto']))
 
 class ConfirmPaymentSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     payment_intent_id = fields.Str(required=True)
     payment_method_id = fields.Str(required=False)  # For card payments
 
@@ -1,7 +1,7 @@
-from marshmallow import Schema, fields, validate, validates, ValidationError
-from src.models.product import Product, Category
+from marshmallow import EXCLUDE, Schema, ValidationError, fields, validate, validates_schema
+from src.schemas.base import ModelSchema, LengthBoundsSchema
 
-class CategorySchema(Schema):
+class CategorySchema(ModelSchema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
     description = fields.Str(required=False)
@@ -10,33 +10,60 @@ class CategorySchema(Schema):
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
 
-class ProductCreateSchema(Schema):
-    name = fields.Str(required=True, validate=validate.Length(min=1, max=200))
+class CategoryMiniSchema(ModelSchema):
+    """Category reference embedded in product cards"""
+    id = fields.Int()
+    name = fields.Str()
+
+class ProductCreateSchema(LengthBoundsSchema):
+    class Meta:
+        unknown = EXCLUDE
+
+    name = fields.Str(required=True)
     description = fields.Str(required=False)
     price = fields.Decimal(required=True, validate=validate.Range(min=0))
     category_id = fields.Int(required=True)
-    brand = fields.Str(required=False, validate=validate.Length(max=100))
-    model = fields.Str(required=False, validate=validate.Length(max=100))
+    brand = fields.Str(required=False)
+    model = fields.Str(required=False)
     stock_quantity = fields.Int(required=True, validate=validate.Range(min=0))
-    sku = fields.Str(required=True, validate=validate.Length(min=1, max=50))
+    sku = fields.Str(required=True)
     images = fields.List(fields.Url(), required=False, load_default=list)
     specifications = fields.Dict(required=False, load_default=dict)
     is_active = fields.Bool(required=False, load_default=True)
     is_featured = fields.Bool(required=False, load_default=False)
-    meta_title = fields.Str(required=False, validate=validate.Length(max=200))
+    meta_title = fields.Str(required=False)
     meta_description = fields.Str(required=False)
 
-    @validates('sku')
-    def validate_sku_unique(self, value):
-        if Product.query.filter_by(sku=value).first():
-            raise ValidationError('SKU already exists.')
+    length_bounds = (
+        ('name', 1, 200),
+        ('brand', None, 100),
+        ('model', None, 100),
+        ('sku', 1, 50),
+        ('meta_title', None, 200)
+    )
+
+class ProductBulkCreateSchema(Schema):
+    """Batch of products for one bulk insert; category and SKU conflicts are checked per batch in the route"""
+    class Meta:
+        unknown = EXCLUDE
 
-    @validates('category_id')
-    def validate_category_exists(self, value):
-        if not Category.query.get(value):
-            raise ValidationError('Category does not exist.')
+    items = fields.List(fields.Nested(ProductCreateSchema), required=True, validate=validate.Length(min=1, max=100))
+
+    @validates_schema(skip_on_field_errors=True)
+    def validate_unique_skus(self, data, **kwargs):
+        seen = set()
+        errors = {}
+        for index, item in enumerate(data['items']):
+            if item['sku'] in seen:
+                errors[index] = {'sku': ['Duplicate SKU in batch.']}
+            seen.add(item['sku'])
+        if errors:
+            raise ValidationError({'items': errors})
 
 class ProductUpdateSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     name = fields.Str(required=False, validate=validate.Length(min=1, max=200))
     description = fields.Str(required=False)
     price = fields.Decimal(required=False, validate=validate.Range(min=0))
@@ -51,12 +78,7 @@ class ProductUpdateSchema(Schema):
     meta_title = fields.Str(required=False, validate=validate.Length(max=200))
     meta_description = fields.Str(required=False)
 
-    @validates('category_id')
-    def validate_category_exists(self, value):
-        if value and not Category.query.get(value):
-            raise ValidationError('Category does not exist.')
-
-class ProductResponseSchema(Schema):
+class ProductResponseSchema(ModelSchema):
     id = fields.Int()
     name = fields.Str()
     description = fields.Str()
@@ -76,7 +98,22 @@ class ProductResponseSchema(Schema):
     created_at = fields.DateTime()
     updated_at = fields.DateTime()
 
+class ProductCardSchema(ModelSchema):
+    """Product listing card; get_products only loads these columns"""
+    id = fields.Int()
+    name = fields.Str()
+    price = fields.Decimal()
+    category_id = fields.Int()
+    category = fields.Nested(CategoryMiniSchema)
+    brand = fields.Str()
+    stock_quantity = fields.Int()
+    images = fields.List(fields.Str())
+    is_featured = fields.Bool()
+
 class ProductSearchSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     query = fields.Str(required=False)
     category_id = fields.Int(required=False)
     brand = fields.Str(required=False)
@@ -84,5 +121,6 @@ class ProductSearchSchema(Schema):
     max_price = fields.Decimal(required=False, validate=validate.Range(min=0))
     in_stock_only = fields.Bool(required=False, load_default=True)
     page = fields.Int(required=False, load_default=1, validate=validate.Range(min=1))
+    after = fields.Str(required=False)  # Keyset cursor; takes precedence over page
     per_page = fields.Int(required=False, load_default=20, validate=validate.Range(min=1, max=100))
 
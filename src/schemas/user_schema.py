@@ -1,23 +1,25 @@
-from marshmallow import Schema, fields, validate, validates, ValidationError
-from src.models.user import User, UserRole
+from marshmallow import EXCLUDE, Schema, fields, validate
+from src.schemas.base import ModelSchema
+from src.models.user import UserRole
 
 class UserRegistrationSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     email = fields.Email(required=True, validate=validate.Length(max=120))
     password = fields.Str(required=True, validate=validate.Length(min=6, max=128))
     first_name = fields.Str(required=True, validate=validate.Length(min=1, max=50))
     last_name = fields.Str(required=True, validate=validate.Length(min=1, max=50))
     phone = fields.Str(required=False, validate=validate.Length(max=20))
 
-    @validates('email')
-    def validate_email_unique(self, value):
-        if User.query.filter_by(email=value).first():
-            raise ValidationError('Email already registered.')
-
 class UserLoginSchema(Schema):
     email = fields.Email(required=True)
     password = fields.Str(required=True)
 
 class UserUpdateSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
     first_name = fields.Str(required=False, validate=validate.Length(min=1, max=50))
     last_name = fields.Str(required=False, validate=validate.Length(min=1, max=50))
     phone = fields.Str(required=False, validate=validate.Length(max=20))
@@ -34,12 +36,7 @@ class AdminUserCreateSchema(Schema):
     phone = fields.Str(required=False, validate=validate.Length(max=20))
     role = fields.Enum(UserRole, required=False, load_default=UserRole.USER)
 
-    @validates('email')
-    def validate_email_unique(self, value):
-        if User.query.filter_by(email=value).first():
-            raise ValidationError('Email already registered.')
-
-class UserResponseSchema(Schema):
+class UserResponseSchema(ModelSchema):
     id = fields.Int()
     email = fields.Email()
     first_name = fields.Str()
@@ -1,11 +1,52 @@
+import requests
 import stripe
 from decimal import Decimal
-from src.config import Config
-from src.utils.helpers import calculate_order_total
+from types import MappingProxyType
+from requests.adapters import HTTPAdapter
+from src.config import Config, PaymentMethod
+from src.utils.helpers import calculate_order_total, to_cents
 
 # Configure Stripe
 stripe.api_key = Config.STRIPE_SECRET_KEY
 
+# One pooled session for every Stripe call, so request threads reuse warm
+# TLS connections to api.stripe.com instead of each opening their own
+_stripe_session = requests.Session()
+_stripe_session.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=50))
+stripe.default_http_client = stripe.RequestsClient(session=_stripe_session)
+
+# Stripe payment_method_types per checkout method; card methods use the default
+PAYMENT_METHOD_TYPES = {'pix': ('pix',), 'boleto': ('boleto',)}
+CARD_PAYMENT_METHOD_TYPES = ('card',)
+
+# Payment methods and their fees; Config is fixed at import, so this is built once (read-only)
+PAYMENT_METHODS = MappingProxyType({
+    'credit_card': MappingProxyType({
+        'name': 'Cartão de Crédito',
+        'tax_rate': Config.TAX_RATES[PaymentMethod.CREDIT_CARD],
+        'fixed_fee': Config.FIXED_FEES[PaymentMethod.CREDIT_CARD] / 100,
+        'description': 'Pagamento com cartão de crédito'
+    }),
+    'debit_card': MappingProxyType({
+        'name': 'Cartão de Débito',
+        'tax_rate': Config.TAX_RATES[PaymentMethod.DEBIT_CARD],
+        'fixed_fee': Config.FIXED_FEES[PaymentMethod.DEBIT_CARD] / 100,
+        'description': 'Pagamento com cartão de débito'
+    }),
+    'pix': MappingProxyType({
+        'name': 'PIX',
+        'tax_rate': Config.TAX_RATES[PaymentMethod.PIX],
+        'fixed_fee': Config.FIXED_FEES[PaymentMethod.PIX] / 100,
+        'description': 'Pagamento instantâneo via PIX'
+    }),
+    'boleto': MappingProxyType({
+        'name': 'Boleto Bancário',
+        'tax_rate': Config.TAX_RATES[PaymentMethod.BOLETO],
+        'fixed_fee': Config.FIXED_FEES[PaymentMethod.BOLETO] / 100,
+        'description': 'Pagamento via boleto bancário'
+    })
+})
+
 class PaymentService:
     
     @staticmethod
@@ -19,30 +60,29 @@ class PaymentService:
                 shipping_amount=order.shipping_amount
             )
             
-            # Convert to cents (Stripe uses cents)
-            amount_cents = int(total_info['total_amount'] * 100)
+            # Stripe charges in cents
+            amount_cents = total_info['total_amount_cents']
             
-            # Payment method configuration
-            payment_method_types = ['card']
-            if payment_method == 'pix':
-                payment_method_types = ['pix']
-            elif payment_method == 'boleto':
-                payment_method_types = ['boleto']
-            
-            # Create payment intent
-            intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency='brl',
-                payment_method_types=payment_method_types,
-                metadata={
+            intent_params = {
+                'amount': amount_cents,
+                'currency': 'brl',
+                'payment_method_types': PAYMENT_METHOD_TYPES.get(payment_method, CARD_PAYMENT_METHOD_TYPES),
+                'metadata': {
                     'order_id': order.id,
                     'order_number': order.order_number,
                     'user_id': order.user_id,
                     'payment_method': payment_method
-                },
-                automatic_payment_methods={
-                    'enabled': True
-                } if payment_method == 'credit_card' else None
+                }
+            }
+            # Only sent for credit cards; Stripe rejects an explicit null
+            if payment_method == 'credit_card':
+                intent_params['automatic_payment_methods'] = {'enabled': True}
+            
+            # Create payment intent; a retried request for the same order, method and amount
+            # gets Stripe's stored response instead of a second intent
+            intent = stripe.PaymentIntent.create(
+                idempotency_key=f"payment-intent:{order.order_number}:{payment_method}:{amount_cents}",
+                **intent_params
             )
             
             return {
@@ -106,12 +146,16 @@ class PaymentService:
             }
             
             if amount:
-                refund_data['amount'] = int(amount * 100)  # Convert to cents
+                refund_data['amount'] = to_cents(amount)
             
             if reason:
                 refund_data['reason'] = reason
             
-            refund = stripe.Refund.create(**refund_data)
+            # Retried requests for the same refund are answered from Stripe's idempotency store
+            refund = stripe.Refund.create(
+                idempotency_key=f"refund:{payment_intent_id}:{refund_data.get('amount', 'full')}:{reason or ''}",
+                **refund_data
+            )
             
             return {
                 'refund_id': refund.id,
@@ -127,30 +171,5 @@ class PaymentService:
     @staticmethod
     def get_payment_methods():
         """Get available payment methods with fees"""
-        return {
-            'credit_card': {
-                'name': 'Cartão de Crédito',
-                'tax_rate': Config.TAX_RATES['credit_card'],
-                'fixed_fee': Config.FIXED_FEES['credit_card'] / 100,
-                'description': 'Pagamento com cartão de crédito'
-            },
-            'debit_card': {
-                'name': 'Cartão de Débito',
-                'tax_rate': Config.TAX_RATES['debit_card'],
-                'fixed_fee': Config.FIXED_FEES['debit_card'] / 100,
-                'description': 'Pagamento com cartão de débito'
-            },
-            'pix': {
-                'name': 'PIX',
-                'tax_rate': Config.TAX_RATES['pix'],
-                'fixed_fee': Config.FIXED_FEES['pix'] / 100,
-                'description': 'Pagamento instantâneo via PIX'
-            },
-            'boleto': {
-                'name': 'Boleto Bancário',
-                'tax_rate': Config.TAX_RATES['boleto'],
-                'fixed_fee': Config.FIXED_FEES['boleto'] / 100,
-                'description': 'Pagamento via boleto bancário'
-            }
-        }
+        return PAYMENT_METHODS
 
@@ -0,0 +1,66 @@
+from flask import request
+from flask_caching import Cache
+from flask_caching.backends import SimpleCache
+from flask_jwt_extended import get_jwt_identity
+from ulid import ULID
+
+cache = Cache()
+
+CATEGORIES_KEY = 'categories'
+DASHBOARD_KEY = 'admin:dashboard'
+PAYMENT_METHODS_KEY = 'payment_methods'
+PRODUCTS_GENERATION_KEY = 'products_generation'
+
+# Seconds a user's role/active flags may be served from cache after a change elsewhere
+AUTHZ_TIMEOUT = 30
+
+def cache_is_shared():
+    """True when every worker sees the same cache, so an invalidation reaches all of them"""
+    return not isinstance(cache.cache, SimpleCache)
+
+def cache_ok_only(rv):
+    """Only cache successful view results, never errors"""
+    return isinstance(rv, tuple) and rv[1] == 200
+
+def invalidate_products():
+    """Drop every cached product response by starting a new catalog generation"""
+    generation = str(ULID())
+    cache.set(PRODUCTS_GENERATION_KEY, generation, timeout=0)
+    return generation
+
+def products_generation():
+    """Current catalog generation; product cache keys embed it"""
+    generation = cache.get(PRODUCTS_GENERATION_KEY)
+    if generation is None:
+        generation = invalidate_products()
+    return generation
+
+def products_cache_key(*args, **kwargs):
+    """Cache key for product reads: catalog generation + path + query string"""
+    return f"products:{products_generation()}:{request.full_path}"
+
+def invalidate_categories():
+    """Drop the cached category list"""
+    cache.delete(CATEGORIES_KEY)
+
+def invalidate_dashboard():
+    """Drop the cached admin dashboard stats"""
+    cache.delete(DASHBOARD_KEY)
+
+def user_cache_key(user_id):
+    """Cache key for a user's /me profile"""
+    return f"me:{user_id}"
+
+def current_user_cache_key(*args, **kwargs):
+    """Cache key for the authenticated user's /me profile"""
+    return user_cache_key(get_jwt_identity())
+
+def authz_cache_key(user_id):
+    """Cache key for a user's (is_active, is_admin) authorization flags"""
+    return f"authz:{user_id}"
+
+def invalidate_user(user_id):
+    """Drop a user's cached /me profile and authorization flags"""
+    # Separate deletes: cachelib's delete_many stops at the first key that is not cached
+    cache.delete(user_cache_key(user_id))
+    cache.delete(authz_cache_key(user_id))
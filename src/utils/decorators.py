@@ -1,17 +1,38 @@
 from functools import wraps
-from flask import jsonify, request
+from flask import current_app, g, jsonify, request, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
-from src.models.user import User, UserRole
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from src.models.user import db, User, UserRole
+from src.utils.cache import cache, cache_is_shared, authz_cache_key, AUTHZ_TIMEOUT
+
+def _load_user(user_id):
+    """Load the authenticated user once per request; later lookups reuse it from g"""
+    if '_current_user' not in g:
+        g._current_user = db.session.get(User, user_id)
+    return g._current_user
+
+def _check_authz(user_id):
+    """(is_active, is_admin) for a user, cached for AUTHZ_TIMEOUT seconds when the cache is shared"""
+    # A per-process cache never sees invalidate_user from other workers; read the DB instead
+    shared = cache_is_shared()
+    key = authz_cache_key(user_id)
+    flags = cache.get(key) if shared else None
+    if flags is None:
+        user = _load_user(user_id)
+        flags = (user is not None and user.is_active, user is not None and user.is_admin())
+        if shared:
+            cache.set(key, flags, timeout=AUTHZ_TIMEOUT)
+    return flags
 
 def admin_required(f):
     """Decorator to require admin role"""
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        _, is_admin = _check_authz(get_jwt_identity())
         
-        if not user or not user.is_admin():
+        if not is_admin:
             return jsonify({'error': 'Admin access required'}), 403
             
         return f(*args, **kwargs)
@@ -22,23 +43,24 @@ def auth_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        is_active, _ = _check_authz(get_jwt_identity())
         
-        if not user or not user.is_active:
+        if not is_active:
             return jsonify({'error': 'User not found or inactive'}), 401
             
         return f(*args, **kwargs)
     return decorated_function
 
 def get_current_user():
-    """Get current authenticated user"""
+    """Get current authenticated user (None for anonymous requests or invalid tokens)"""
+    # Tokens are only read from headers: without the header there is nothing to verify
+    if current_app.config['JWT_HEADER_NAME'] not in request.headers:
+        return None
     try:
         verify_jwt_in_request()
-        current_user_id = get_jwt_identity()
-        return User.query.get(current_user_id)
-    except:
+    except (JWTExtendedException, PyJWTError):
         return None
+    return _load_user(get_jwt_identity())
 
 def validate_json(schema):
     """Decorator to validate JSON input using marshmallow schema"""
@@ -57,6 +79,14 @@ def validate_json(schema):
         return decorated_function
     return decorator
 
+def require_json_body(*exempt_endpoints):
+    """Build a blueprint before_request hook rejecting non-JSON bodies on POST/PUT/PATCH"""
+    def check_json_body():
+        if request.method in ('POST', 'PUT', 'PATCH') and not request.is_json \
+                and request.endpoint not in exempt_endpoints:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+    return check_json_body
+
 def handle_errors(f):
     """Decorator to handle common errors"""
     @wraps(f)
@@ -70,3 +100,16 @@ def handle_errors(f):
             
     return decorated_function
 
+
+def conditional_etag(f):
+    """Decorator to tag successful responses with a content ETag and answer If-None-Match with 304"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        
+        if response.status_code == 200:
+            response.add_etag()
+            response.make_conditional(request)
+            
+        return response
+    return decorated_function
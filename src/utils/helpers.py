@@ -1,58 +1,89 @@
-from decimal import Decimal
-from src.config import Config
+import base64
+import re
+from itertools import chain
+from secrets import token_hex
+from datetime import datetime
+import orjson
+from sqlalchemy import func, inspect, literal, tuple_, and_, or_
+from sqlalchemy.orm import load_only
+from src.config import Config, PaymentMethod
+
+# Tax rates in basis points, converted once (indexed by PaymentMethod like Config's;
+# Config.FIXED_FEES is already in cents)
+_TAX_RATES_BP = tuple(round(rate * 10000) for rate in Config.TAX_RATES)
+
+def to_cents(amount):
+    """Convert a reais amount (at most two decimals, as stored) to integer cents"""
+    return round(float(amount) * 100)
+
+def _payment_fee_cents(amount_cents, method):
+    """(percentage fee, total fee) in cents, the percentage rounded half up to the cent"""
+    percentage_fee = (amount_cents * _TAX_RATES_BP[method] + 5000) // 10000
+    return percentage_fee, percentage_fee + Config.FIXED_FEES[method]
 
 def calculate_payment_fees(amount, payment_method):
     """Calculate payment fees based on method"""
-    amount = Decimal(str(amount))
-    
-    if payment_method not in Config.TAX_RATES:
-        raise ValueError(f"Unsupported payment method: {payment_method}")
-    
-    # Get tax rate and fixed fee
-    tax_rate = Decimal(str(Config.TAX_RATES[payment_method]))
-    fixed_fee = Decimal(str(Config.FIXED_FEES[payment_method])) / 100  # Convert cents to reais
-    
-    # Calculate percentage fee
-    percentage_fee = amount * tax_rate
-    
-    # Total fee
-    total_fee = percentage_fee + fixed_fee
+    method = PaymentMethod.coerce(payment_method)
+    amount_cents = to_cents(amount)
+    percentage_fee, total_fee = _payment_fee_cents(amount_cents, method)
     
     return {
-        'percentage_fee': float(percentage_fee),
-        'fixed_fee': float(fixed_fee),
-        'total_fee': float(total_fee),
-        'amount_with_fee': float(amount + total_fee),
-        'tax_rate': float(tax_rate)
+        'percentage_fee': percentage_fee / 100,
+        'fixed_fee': Config.FIXED_FEES[method] / 100,
+        'total_fee': total_fee / 100,
+        'amount_with_fee': (amount_cents + total_fee) / 100,
+        'tax_rate': Config.TAX_RATES[method]
     }
 
 def calculate_order_total(subtotal, payment_method, shipping_amount=0):
-    """Calculate order total including fees"""
-    subtotal = Decimal(str(subtotal))
-    shipping_amount = Decimal(str(shipping_amount))
+    """Calculate order total including fees (total_amount_cents is what Stripe charges)"""
+    subtotal_cents = to_cents(subtotal)
+    shipping_cents = to_cents(shipping_amount)
     
     # Calculate payment fees
-    fee_info = calculate_payment_fees(subtotal, payment_method)
+    fee_info = calculate_payment_fees(subtotal_cents / 100, payment_method)
     
     # Total amount
-    total_amount = subtotal + Decimal(str(fee_info['total_fee'])) + shipping_amount
+    total_cents = subtotal_cents + to_cents(fee_info['total_fee']) + shipping_cents
     
     return {
-        'subtotal': float(subtotal),
-        'shipping_amount': float(shipping_amount),
+        'subtotal': subtotal_cents / 100,
+        'shipping_amount': shipping_cents / 100,
         'tax_amount': fee_info['total_fee'],
-        'total_amount': float(total_amount),
+        'total_amount': total_cents / 100,
+        'total_amount_cents': total_cents,
         'fee_breakdown': fee_info
     }
 
+# Swaps the English thousands/decimal separators for the Brazilian ones in a single pass
+_BR_SEPARATORS = str.maketrans({',': '.', '.': ','})
+
 def format_currency(amount):
     """Format amount as Brazilian currency"""
-    return f"R$ {amount:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return f"R$ {amount:,.2f}".translate(_BR_SEPARATORS)
+
+# Anything but an ASCII digit (CPF/CEP punctuation and spaces)
+_NON_DIGITS = re.compile(r'[^0-9]')
+
+def _weighted_digit_sum(name, weights):
+    """Compile name(d): the weighted sum of the ASCII digit bytes d, unrolled for fixed weights
+
+    The '0' byte offset of every term is folded into one constant.
+    """
+    weights = tuple(weights)
+    terms = ' + '.join(f'd[{index}] * {weight}' for index, weight in enumerate(weights))
+    namespace = {}
+    exec(f'def {name}(d):\n    return {terms} - {ord("0") * sum(weights)}', namespace)
+    return namespace[name]
+
+# CPF check digit sums over the first 9 and the first 10 digits
+_cpf_sum1 = _weighted_digit_sum('_cpf_sum1', range(10, 1, -1))
+_cpf_sum2 = _weighted_digit_sum('_cpf_sum2', range(11, 1, -1))
 
 def validate_cpf(cpf):
     """Validate Brazilian CPF"""
     # Remove non-numeric characters
-    cpf = ''.join(filter(str.isdigit, cpf))
+    cpf = _NON_DIGITS.sub('', cpf)
     
     # Check if has 11 digits
     if len(cpf) != 11:
@@ -62,38 +93,70 @@ def validate_cpf(cpf):
     if cpf == cpf[0] * 11:
         return False
     
+    # ASCII digit bytes; a byte minus 48 (ord('0')) is the digit's value
+    digits = cpf.encode('ascii')
+    
     # Validate first check digit
-    sum1 = sum(int(cpf[i]) * (10 - i) for i in range(9))
-    digit1 = 11 - (sum1 % 11)
+    digit1 = 11 - (_cpf_sum1(digits) % 11)
     if digit1 >= 10:
         digit1 = 0
     
-    if int(cpf[9]) != digit1:
+    if digits[9] - 48 != digit1:
         return False
     
     # Validate second check digit
-    sum2 = sum(int(cpf[i]) * (11 - i) for i in range(10))
-    digit2 = 11 - (sum2 % 11)
+    digit2 = 11 - (_cpf_sum2(digits) % 11)
     if digit2 >= 10:
         digit2 = 0
     
-    if int(cpf[10]) != digit2:
-        return False
-    
-    return True
+    return digits[10] - 48 == digit2
 
 def validate_cep(cep):
     """Validate Brazilian CEP (postal code)"""
     # Remove non-numeric characters
-    cep = ''.join(filter(str.isdigit, cep))
+    cep = _NON_DIGITS.sub('', cep)
     
     # Check if has 8 digits
     return len(cep) == 8
 
-def paginate_query(query, page=1, per_page=20):
-    """Paginate SQLAlchemy query"""
-    total = query.count()
-    items = query.offset((page - 1) * per_page).limit(per_page).all()
+# Largest page any listing serves
+MAX_PER_PAGE = 100
+
+def paginate_query(query, page=1, per_page=20, yield_per=None, only_columns=None):
+    """Paginate SQLAlchemy query (a filtered entity query, without GROUP BY/DISTINCT)
+
+    With yield_per, 'items' is a lazy iterator fetched in batches of that size
+    (for streamed responses) instead of a list. only_columns limits the entity
+    columns loaded to the ones the response serializes (load_only).
+    """
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    if only_columns:
+        query = query.options(load_only(*only_columns))
+    
+    # The total rides along on every row as COUNT(*) OVER (), so the page and the count
+    # come back in one round trip. The window is computed before LIMIT/OFFSET.
+    rows = query.add_columns(func.count().over().label('total')) \
+        .offset((page - 1) * per_page).limit(per_page)
+    
+    if yield_per:
+        rows = iter(rows.yield_per(yield_per))
+        first = next(rows, None)
+        items = (row[0] for row in chain((first,), rows)) if first is not None else iter(())
+    else:
+        rows = rows.all()
+        first = rows[0] if rows else None
+        items = [row[0] for row in rows]
+    
+    if first is not None:
+        total = first.total
+    elif page == 1:
+        total = 0
+    else:
+        # Past the last page there is no row to carry the total: count separately.
+        # Counting the primary key keeps the table in FROM even when there are no filters.
+        primary_key = inspect(query.column_descriptions[0]['entity']).primary_key[0]
+        total = query.with_entities(func.count(primary_key)).order_by(None).scalar()
     
     return {
         'items': items,
@@ -105,21 +168,84 @@ def paginate_query(query, page=1, per_page=20):
         'has_next': page * per_page < total
     }
 
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(orjson.dumps(list(values))).decode('ascii')
+
+def row_cursor(row, columns):
+    """Cursor pointing just past the given row in an ordering by these columns"""
+    return encode_cursor(getattr(row, column.key) for column in columns)
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor back into values for the given columns (raises ValueError if malformed)"""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        values = [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not all(isinstance(value, column.type.python_type) for column, value in zip(columns, values)):
+        raise ValueError('Invalid cursor')
+    return values
+
+def keyset_paginate(query, columns, after=None, per_page=20, descending=True):
+    """Paginate SQLAlchemy query by seeking past a cursor instead of OFFSET
+
+    Rows are ordered by the given (non-nullable) columns, descending unless
+    `descending` is False or a per-column tuple of flags; the last column must be
+    unique, e.g. the primary key. One extra row is fetched to tell whether there
+    is a next page, so no COUNT is issued.
+    """
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    if isinstance(descending, bool):
+        descending = (descending,) * len(columns)
+    
+    if after:
+        # Bound as parameters: SQLAlchemy refuses < / > against bare True/False
+        values = [literal(value, column.type) for column, value in zip(columns, decode_cursor(after, columns))]
+        if len(set(descending)) == 1:
+            # Uniform direction: a single row-value comparison the index can seek on
+            seek = tuple_(*columns) < tuple_(*values) if descending[0] else tuple_(*columns) > tuple_(*values)
+        else:
+            # Mixed directions: (a after a0) OR (a = a0 AND b after b0) OR ...
+            seek = or_(*(
+                and_(
+                    *(column == value for column, value in zip(columns[:index], values[:index])),
+                    columns[index] < values[index] if descending[index] else columns[index] > values[index]
+                )
+                for index in range(len(columns))
+            ))
+        query = query.filter(seek)
+    
+    ordering = [column.desc() if desc else column.asc() for column, desc in zip(columns, descending)]
+    rows = query.order_by(None).order_by(*ordering).limit(per_page + 1).all()
+    items = rows[:per_page]
+    has_next = len(rows) > per_page
+    
+    return {
+        'items': items,
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': row_cursor(items[-1], columns) if has_next else None
+    }
+
 def generate_sku(category_name, brand=None, model=None):
     """Generate SKU for product"""
-    import uuid
-    
-    # Create base from category
-    base = category_name[:3].upper()
+    # Create base from category, brand and model
+    parts = [category_name[:3].upper()]
     
     if brand:
-        base += f"-{brand[:3].upper()}"
+        parts.append(brand[:3].upper())
     
     if model:
-        base += f"-{model[:3].upper()}"
+        parts.append(model[:3].upper())
     
-    # Add unique identifier
-    unique_id = str(uuid.uuid4())[:8].upper()
+    # Add unique identifier (8 random hex characters)
+    parts.append(token_hex(4).upper())
     
-    return f"{base}-{unique_id}"
+    return '-'.join(parts)
 
@@ -0,0 +1,31 @@
+from decimal import Decimal
+from types import MappingProxyType
+import orjson
+from flask.json.provider import JSONProvider
+
+def _default(obj):
+    """Serialize types orjson does not handle natively"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson (datetimes are encoded natively, Decimal as float)"""
+
+    # Validation error messages use integer keys for list items
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.option).decode('utf-8')
+    
+    def response(self, *args, **kwargs):
+        # orjson already produces UTF-8 bytes; skip the str round trip dumps() needs
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=self.option), mimetype='application/json'
+        )
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)